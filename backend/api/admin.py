@@ -18,13 +18,13 @@ class RecipeIngredientInLine(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ("pk", "name", "author", "favorite_count")
+    list_display = (
+        "pk", "name", "author", "favorites_count", "carts_count"
+    )
+    list_select_related = ("author",)
     inlines = (RecipeIngredientInLine,)
     list_filter = ("name", "author", "tags")
 
-    def favorite_count(self, obj):
-        return obj.favorite.count()
-
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoFieldZ"
     name = "api"
+
+    def ready(self):
+        import api.signals  # noqa: F401
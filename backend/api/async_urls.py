@@ -0,0 +1,29 @@
+from django.urls import URLPattern
+
+from api.async_views import offload
+from api.urls import router
+
+
+ASYNC_ROUTES = {
+    "recipes-list",
+    "recipes-detail",
+    "tags-list",
+    "tags-detail",
+    "ingredients-list",
+    "ingredients-detail",
+    "users-subscriptions",
+}
+
+# Маршруты роутера идут в прежнем порядке, иначе detail-маршрут
+# перехватил бы действия списка вроде download_shopping_cart.
+urlpatterns = [
+    URLPattern(
+        pattern.pattern,
+        offload(pattern.callback),
+        pattern.default_args,
+        pattern.name,
+    )
+    if pattern.name in ASYNC_ROUTES
+    else pattern
+    for pattern in router.urls
+]
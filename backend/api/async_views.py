@@ -0,0 +1,51 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+# В Django 3.2 нет асинхронного ORM: запросы к БД выполняются в
+# ограниченном пуле потоков, а event loop тем временем обслуживает
+# остальных клиентов.
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_DB_THREADS, thread_name_prefix="db"
+)
+
+
+def run_view(view, request, *args, **kwargs):
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        # Ответ DRF рендерится здесь же, а не в потоке обработчика ASGI.
+        if hasattr(response, "render"):
+            metrics = getattr(request, "metrics", None)
+            if metrics is not None:
+                metrics.start_render(response)
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def offload(view):
+    """Асинхронный вид, выполняющий синхронный view в пуле потоков БД."""
+
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        # Контекст запроса (в том числе замеры SQL) переходит в поток.
+        return await asyncio.get_running_loop().run_in_executor(
+            db_executor,
+            partial(
+                contextvars.copy_context().run,
+                run_view,
+                view,
+                request,
+                *args,
+                **kwargs,
+            ),
+        )
+
+    return async_view
@@ -0,0 +1,236 @@
+from django.db import connection
+
+from recipes.counters import COUNTERS, reconcile
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipePopularity,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from users.models import Follow, User
+
+
+EMAIL_DOMAIN = "benchmark.foodgram.local"
+BATCH_SIZE = 5000
+TAGS_COUNT = 10
+INGREDIENTS_COUNT = 2000
+INGREDIENTS_PER_RECIPE = (5, 30)
+TAGS_PER_RECIPE = (1, 3)
+FAVORITES_PER_USER = (0, 30)
+CARTS_PER_USER = (0, 5)
+FOLLOWS_PER_USER = (0, 20)
+OWN_RECIPES = 20
+OWN_CART = 10
+OWN_FOLLOWS = 20
+WORDS = (
+    "Суп", "Салат", "Пирог", "Каша", "Рагу", "Запеканка", "Омлет",
+    "Паста", "Плов", "Блины", "Котлеты", "Гуляш", "Борщ", "Щи",
+)
+
+
+class BenchmarkData:
+    """Идентификаторы созданных данных, нужные сценариям."""
+
+    def __init__(self, user, author_ids, recipe_ids, own_recipe_ids,
+                 cart_recipe_ids, followed_ids, tag_ids, tag_slugs,
+                 ingredient_ids, ingredient_names):
+        self.user = user
+        self.author_ids = author_ids
+        self.recipe_ids = recipe_ids
+        self.own_recipe_ids = own_recipe_ids
+        self.cart_recipe_ids = cart_recipe_ids
+        self.followed_ids = followed_ids
+        self.tag_ids = tag_ids
+        self.tag_slugs = tag_slugs
+        self.ingredient_ids = ingredient_ids
+        self.ingredient_names = ingredient_names
+
+
+def create_users(count):
+    User.objects.bulk_create(
+        (
+            User(
+                email=f"user{number}@{EMAIL_DOMAIN}",
+                username=f"bench{number}",
+                first_name="Benchmark",
+                last_name=f"User {number}",
+            )
+            for number in range(count + 1)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    # bulk_create возвращает id не во всех СУБД.
+    return list(
+        User.objects.filter(email__endswith=f"@{EMAIL_DOMAIN}")
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+
+def get_tags():
+    if Tag.objects.count() < TAGS_COUNT:
+        Tag.objects.bulk_create(
+            (
+                Tag(
+                    name=f"Benchmark {number}",
+                    color=f"#BE{number:04X}",
+                    slug=f"benchmark-{number}",
+                )
+                for number in range(TAGS_COUNT)
+            ),
+            ignore_conflicts=True,
+        )
+    return dict(Tag.objects.values_list("id", "slug"))
+
+
+def get_ingredients():
+    if Ingredient.objects.count() < INGREDIENTS_COUNT:
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(
+                    name=f"{WORDS[number % len(WORDS)].lower()} {number}",
+                    measurement_unit="г",
+                )
+                for number in range(INGREDIENTS_COUNT)
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+    return dict(Ingredient.objects.values_list("id", "name"))
+
+
+def create_recipes(author_ids, count, rng):
+    Recipe.objects.bulk_create(
+        (
+            Recipe(
+                author_id=author_ids[number % len(author_ids)],
+                name=f"{rng.choice(WORDS)} {number}",
+                text="Описание рецепта для нагрузочного теста.",
+                cooking_time=rng.randint(5, 180),
+            )
+            for number in range(count)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+def bulk_create(model, objects):
+    model.objects.bulk_create(
+        objects, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def sample(rng, population, bounds):
+    return rng.sample(population, min(len(population), rng.randint(*bounds)))
+
+
+def generate(rng, users_count, recipes_count):
+    """Пользователи, рецепты, подписки, избранное и корзины.
+
+    Первый пользователь - тот, от имени которого идут запросы: у него
+    есть свои рецепты, подписки и корзина.
+    """
+    user_ids = create_users(users_count)
+    user_id, author_ids = user_ids[0], user_ids[1:]
+    tags = get_tags()
+    ingredients = get_ingredients()
+    tag_ids = list(tags)
+    ingredient_ids = list(ingredients)
+    create_recipes([user_id], OWN_RECIPES, rng)
+    create_recipes(author_ids, recipes_count, rng)
+    recipes = Recipe.objects.filter(
+        author__email__endswith=f"@{EMAIL_DOMAIN}"
+    ).order_by("id")
+    own_recipe_ids = list(
+        recipes.filter(author_id=user_id).values_list("id", flat=True)
+    )
+    recipe_ids = list(
+        recipes.exclude(author_id=user_id).values_list("id", flat=True)
+    )
+    bulk_create(
+        Recipe.tags.through,
+        (
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in own_recipe_ids + recipe_ids
+            for tag_id in sample(rng, tag_ids, TAGS_PER_RECIPE)
+        ),
+    )
+    bulk_create(
+        RecipeIngredient,
+        (
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500),
+            )
+            for recipe_id in own_recipe_ids + recipe_ids
+            for ingredient_id in sample(
+                rng, ingredient_ids, INGREDIENTS_PER_RECIPE
+            )
+        ),
+    )
+    for model, bounds in (
+        (Favorite, FAVORITES_PER_USER),
+        (ShoppingCart, CARTS_PER_USER),
+    ):
+        bulk_create(
+            model,
+            (
+                model(user_id=follower_id, recipe_id=recipe_id)
+                for follower_id in author_ids
+                for recipe_id in sample(rng, recipe_ids, bounds)
+            ),
+        )
+    # Половина рецептов и авторов остается для сценариев, добавляющих
+    # рецепты в корзину и подписки.
+    own_cart = min(OWN_CART, len(recipe_ids) // 2)
+    cart_recipe_ids = sample(rng, recipe_ids, (own_cart, own_cart))
+    bulk_create(
+        ShoppingCart,
+        (
+            ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+            for recipe_id in cart_recipe_ids
+        ),
+    )
+    own_follows = min(OWN_FOLLOWS, len(author_ids) // 2)
+    followed_ids = sample(rng, author_ids, (own_follows, own_follows))
+    bulk_create(
+        Follow,
+        (
+            Follow(user_id=user_id, author_id=author_id)
+            for author_id in followed_ids
+        ),
+    )
+    bulk_create(
+        Follow,
+        (
+            Follow(user_id=follower_id, author_id=author_id)
+            for follower_id in author_ids
+            for author_id in sample(rng, author_ids, FOLLOWS_PER_USER)
+            if author_id != follower_id
+        ),
+    )
+    ShoppingListItem.objects.rebuild()
+    # bulk_create не отправляет сигналы, которые ведут счётчики и рейтинги.
+    for counter in COUNTERS:
+        reconcile(*counter)
+    RecipePopularity.objects.rebuild()
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+    return BenchmarkData(
+        user=User.objects.get(id=user_id),
+        author_ids=author_ids,
+        recipe_ids=recipe_ids,
+        own_recipe_ids=own_recipe_ids,
+        cart_recipe_ids=cart_recipe_ids,
+        followed_ids=followed_ids,
+        tag_ids=tag_ids,
+        tag_slugs=list(tags.values()),
+        ingredient_ids=ingredient_ids,
+        ingredient_names=list(ingredients.values()),
+    )
@@ -0,0 +1,47 @@
+import statistics
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def summarize(timings, queries, errors, elapsed):
+    """Итоги сценария: пропускная способность, задержки и SQL-запросы."""
+    return {
+        "requests": len(timings),
+        "errors": errors,
+        "throughput": round(len(timings) / elapsed, 2) if elapsed else None,
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "queries_median": statistics.median(queries),
+        "queries_max": max(queries),
+    }
+
+
+def format_change(old, new):
+    if not old:
+        return "—"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare(baseline, current):
+    """Строки сравнения с прошлым отчетом по общим сценариям."""
+    lines = []
+    for name, result in current["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if old is None:
+            continue
+        lines.append(
+            f"{name}: "
+            f"p50 {format_change(old['p50_ms'], result['p50_ms'])}, "
+            f"p95 {format_change(old['p95_ms'], result['p95_ms'])}, "
+            f"p99 {format_change(old['p99_ms'], result['p99_ms'])}, "
+            "throughput "
+            f"{format_change(old['throughput'], result['throughput'])}, "
+            f"queries {old['queries_median']} -> "
+            f"{result['queries_median']}"
+        )
+    return lines
@@ -0,0 +1,170 @@
+PAGE_SIZE = 6
+IMAGE = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA"
+    "DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+)
+
+
+def choose_other(rng, population, excluded):
+    """Случайный элемент не из excluded: для запросов, меняющих связи."""
+    if excluded.issuperset(population):
+        raise ValueError("Все элементы исключены.")
+    while True:
+        value = rng.choice(population)
+        if value not in excluded:
+            return value
+
+
+def get_page(count, rng):
+    # Чаще всего листают первые страницы ленты.
+    pages = max(1, count // PAGE_SIZE)
+    return min(pages, int(rng.expovariate(1 / 3)) + 1)
+
+
+def feed(data, rng):
+    while True:
+        page = get_page(len(data.recipe_ids), rng)
+        yield "get", f"/api/recipes/?page={page}", None
+
+
+def anonymous_feed(data, rng):
+    return feed(data, rng)
+
+
+def feed_tags(data, rng):
+    while True:
+        tags = "&".join(
+            f"tags={slug}"
+            for slug in rng.sample(
+                data.tag_slugs, min(len(data.tag_slugs), rng.randint(1, 3))
+            )
+        )
+        # С фильтром по тегам в выдаче остается меньше страниц.
+        page = get_page(len(data.recipe_ids) // 4, rng)
+        yield "get", f"/api/recipes/?{tags}&page={page}", None
+
+
+def feed_ranked(data, rng):
+    while True:
+        ordering = rng.choice(("popular", "trending"))
+        page = get_page(len(data.recipe_ids), rng)
+        yield "get", f"/api/recipes/?ordering={ordering}&page={page}", None
+
+
+def feed_favorited(data, rng):
+    while True:
+        yield "get", "/api/recipes/?is_favorited=1", None
+
+
+def recipe_detail(data, rng):
+    while True:
+        yield "get", f"/api/recipes/{rng.choice(data.recipe_ids)}/", None
+
+
+def tags(data, rng):
+    while True:
+        yield "get", "/api/tags/", None
+
+
+def autocomplete(data, rng):
+    # Ввод по буквам: префиксы из 1-3 символов.
+    while True:
+        name = rng.choice(data.ingredient_names)
+        for length in range(1, min(3, len(name)) + 1):
+            yield "get", f"/api/ingredients/?name={name[:length]}", None
+
+
+def recipe_payload(data, rng):
+    return {
+        "name": "Рецепт для нагрузочного теста",
+        "text": "Описание",
+        "cooking_time": rng.randint(5, 180),
+        "image": IMAGE,
+        "tags": rng.sample(data.tag_ids, min(2, len(data.tag_ids))),
+        "ingredients": [
+            {"id": ingredient_id, "amount": rng.randint(1, 500)}
+            for ingredient_id in rng.sample(
+                data.ingredient_ids,
+                min(len(data.ingredient_ids), rng.randint(5, 30)),
+            )
+        ],
+    }
+
+
+def recipe_create(data, rng):
+    while True:
+        yield "post", "/api/recipes/", recipe_payload(data, rng)
+
+
+def recipe_update(data, rng):
+    while True:
+        payload = recipe_payload(data, rng)
+        del payload["image"]
+        recipe_id = rng.choice(data.own_recipe_ids)
+        yield "patch", f"/api/recipes/{recipe_id}/", payload
+
+
+def favorite(data, rng):
+    while True:
+        recipe_id = rng.choice(data.recipe_ids)
+        yield "post", f"/api/recipes/{recipe_id}/favorite/", None
+        yield "delete", f"/api/recipes/{recipe_id}/favorite/", None
+
+
+def shopping_cart(data, rng):
+    cart = set(data.cart_recipe_ids)
+    while True:
+        recipe_id = choose_other(rng, data.recipe_ids, cart)
+        yield "post", f"/api/recipes/{recipe_id}/shopping_cart/", None
+        yield "delete", f"/api/recipes/{recipe_id}/shopping_cart/", None
+
+
+def subscriptions(data, rng):
+    while True:
+        yield "get", "/api/users/subscriptions/?recipes_limit=3", None
+
+
+def subscribe(data, rng):
+    followed = set(data.followed_ids)
+    while True:
+        author_id = choose_other(rng, data.author_ids, followed)
+        yield "post", f"/api/users/{author_id}/subscribe/", None
+        yield "delete", f"/api/users/{author_id}/subscribe/", None
+
+
+def users(data, rng):
+    while True:
+        yield "get", "/api/users/", None
+
+
+def me(data, rng):
+    while True:
+        yield "get", "/api/users/me/", None
+
+
+def download_shopping_cart(data, rng):
+    while True:
+        yield "get", "/api/recipes/download_shopping_cart/", None
+
+
+# Сценарии, запросы которых идут без авторизации.
+ANONYMOUS_SCENARIOS = {"anonymous_feed"}
+SCENARIOS = {
+    "feed": feed,
+    "anonymous_feed": anonymous_feed,
+    "feed_tags": feed_tags,
+    "feed_ranked": feed_ranked,
+    "feed_favorited": feed_favorited,
+    "recipe_detail": recipe_detail,
+    "tags": tags,
+    "autocomplete": autocomplete,
+    "recipe_create": recipe_create,
+    "recipe_update": recipe_update,
+    "favorite": favorite,
+    "shopping_cart": shopping_cart,
+    "subscriptions": subscriptions,
+    "subscribe": subscribe,
+    "users": users,
+    "me": me,
+    "download_shopping_cart": download_shopping_cart,
+}
@@ -0,0 +1,167 @@
+import hashlib
+from collections import Counter
+
+from django.core.cache import caches
+from django.db.models import Count, Max, Value
+from django.utils.cache import (
+    get_conditional_response,
+    patch_vary_headers,
+    quote_etag,
+)
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.models import Favorite, ShoppingCart
+from recipes.versions import get_versions
+from users.models import Follow
+
+
+RESPONSE_CACHE_ALIAS = "responses"
+
+response_cache_stats = Counter()
+
+
+class AnonymousResponseCacheMixin:
+    """Кэширование ответов list/retrieve для анонимных пользователей.
+
+    Ключ включает параметры запроса и версии данных, поэтому изменения
+    рецептов, тегов и ингредиентов делают старые записи недоступными.
+    Ответы авторизованных пользователей не кэшируются: в них есть
+    персональные флаги is_favorited и is_in_shopping_cart.
+    """
+
+    cache_versions = ()
+
+    def get_cache_versions(self):
+        return self.cache_versions
+
+    def get_cache_state(self):
+        """Состояние данных, от которого зависит ответ."""
+        return get_versions(*self.get_cache_versions())
+
+    def get_response_cache_key(self):
+        request = self.request
+        params = sorted(request.query_params.lists())
+        versions = self.get_cache_state()
+        return make_cache_key(
+            "response",
+            self.basename,
+            self.action,
+            request.get_host(),
+            str(self.kwargs.get(self.lookup_field, "")),
+            params,
+            versions,
+        )
+
+    def cached_response(self, get_response):
+        if self.request.user.is_authenticated:
+            return get_response()
+        response_cache = caches[RESPONSE_CACHE_ALIAS]
+        key = self.get_response_cache_key()
+        cached = response_cache.get(key)
+        if cached is not None:
+            response_cache_stats["hit"] += 1
+            data, status_code = cached
+            response = Response(data, status=status_code)
+            response["X-Cache"] = "HIT"
+            return response
+        response_cache_stats["miss"] += 1
+        response = get_response()
+        if response.status_code == status.HTTP_200_OK:
+            response_cache.set(key, (response.data, response.status_code))
+        response["X-Cache"] = "MISS"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            lambda: super(AnonymousResponseCacheMixin, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            lambda: super(AnonymousResponseCacheMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
+
+
+def make_cache_key(prefix, *parts):
+    """Ключ кэша из параметров запроса, допустимый и для memcached."""
+    return f"{prefix}:{hashlib.sha1(repr(parts).encode()).hexdigest()}"
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.sha1(repr(parts).encode()).hexdigest())
+
+
+def get_aggregate_state(queryset):
+    """Дата последнего изменения и число объектов в выборке."""
+    state = queryset.order_by().aggregate(
+        last_modified=Max("updated_at"), count=Count("id")
+    )
+    return state["last_modified"], state["count"]
+
+
+def get_user_state(user):
+    """Состояние избранного, корзины и подписок пользователя.
+
+    Строки этих таблиц только добавляются и удаляются, поэтому
+    пара (число строк, максимальный id) меняется при любом изменении.
+    """
+    querysets = [
+        model.objects.filter(user=user)
+        .order_by()
+        .values("user")
+        .annotate(kind=Value(kind), count=Count("id"), last=Max("id"))
+        .values_list("kind", "count", "last")
+        for kind, model in (
+            ("favorite", Favorite),
+            ("cart", ShoppingCart),
+            ("follow", Follow),
+        )
+    ]
+    return sorted(querysets[0].union(*querysets[1:], all=True))
+
+
+class ConditionalGetMixin:
+    """Ответ 304 на условные GET-запросы до сериализации.
+
+    Валидаторы считаются в get_validators по версиям данных или
+    по одной строке, а не по готовому телу ответа.
+    """
+
+    def get_validators(self):
+        """Пара (ETag, дата изменения); None, если валидатора нет."""
+        return None, None
+
+    def conditional_response(self, get_response):
+        etag, last_modified = self.get_validators()
+        timestamp = last_modified and int(last_modified.timestamp())
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = get_response()
+        if etag:
+            response["ETag"] = etag
+        if timestamp:
+            response["Last-Modified"] = http_date(timestamp)
+        patch_vary_headers(response, ("Authorization",))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            lambda: super(ConditionalGetMixin, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            lambda: super(ConditionalGetMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
@@ -0,0 +1,51 @@
+import csv
+import json
+
+
+SHOPPING_CART_TITLE = "Список необходимых ингредиентов:"
+SHOPPING_CART_FIELDS = ("name", "amount", "measurement_unit")
+
+
+class Echo:
+    """Буфер, который сразу отдаёт записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def get_shopping_cart_items(ingredients):
+    for ingredient in ingredients:
+        yield {
+            "name": ingredient["ingredient__name"],
+            "amount": ingredient["ingredient_sum"],
+            "measurement_unit": ingredient["ingredient__measurement_unit"],
+        }
+
+
+def export_txt(ingredients):
+    yield SHOPPING_CART_TITLE
+    for item in get_shopping_cart_items(ingredients):
+        yield f"\n{item['name']} - {item['amount']} {item['measurement_unit']}"
+
+
+def export_csv(ingredients):
+    writer = csv.DictWriter(Echo(), fieldnames=SHOPPING_CART_FIELDS)
+    yield writer.writeheader()
+    for item in get_shopping_cart_items(ingredients):
+        yield writer.writerow(item)
+
+
+def export_json(ingredients):
+    yield "["
+    separator = ""
+    for item in get_shopping_cart_items(ingredients):
+        yield separator + json.dumps(item, ensure_ascii=False)
+        separator = ","
+    yield "]"
+
+
+SHOPPING_CART_EXPORTERS = {
+    "txt": export_txt,
+    "csv": export_csv,
+    "json": export_json,
+}
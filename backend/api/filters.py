@@ -1,6 +1,33 @@
+from django.core.cache import cache
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.constants import LOOKUP_SEP
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Recipe, Ingredient
+from recipes.models import Recipe, Ingredient, Tag
+from recipes.versions import get_version
+
+
+INGREDIENTS_SEARCH_LIMIT = 50
+TAG_IDS_CACHE_TIMEOUT = 60 * 60
+
+# Сортировки ленты рецептов, ?ordering=...: поле, по убыванию которого
+# идут рецепты, при равенстве - более новые.
+RECIPE_ORDERINGS = {
+    "favorites": "favorites_count",
+    "carts": "carts_count",
+    "popular": "popularity__popular",
+    "trending": "popularity__trending",
+}
+
+
+def get_tag_ids(slugs):
+    """id тегов по slug; соответствие кэшируется до изменения тегов."""
+    key = f"tag_ids:{get_version('tags')}"
+    tag_ids = cache.get(key)
+    if tag_ids is None:
+        tag_ids = dict(Tag.objects.values_list("slug", "id"))
+        cache.set(key, tag_ids, TAG_IDS_CACHE_TIMEOUT)
+    return {tag_ids[slug] for slug in slugs if slug in tag_ids}
 
 
 class RecipeFilter(FilterSet):
@@ -10,11 +37,42 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method="get_is_in_shopping_cart"
     )
-    tags = filters.AllValuesMultipleFilter(field_name="tags__slug")
+    tags = filters.CharFilter(method="get_tags")
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method="get_ordering",
+    )
 
     class Meta:
         model = Recipe
-        fields = ("author", "tags", "is_favorited", "is_in_shopping_cart")
+        fields = (
+            "author",
+            "tags",
+            "is_favorited",
+            "is_in_shopping_cart",
+            "ordering",
+        )
+
+    def get_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов, без JOIN и DISTINCT."""
+        tag_ids = get_tag_ids(self.data.getlist(name))
+        return queryset.filter(
+            id__in=Recipe.tags.through.objects.filter(
+                tag_id__in=tag_ids
+            ).values("recipe_id")
+        )
+
+    def get_ordering(self, queryset, name, value):
+        """Сортировка по счётчикам или рейтингу рецепта, без агрегации.
+
+        Значение сортировки доступно как score: по нему курсорная
+        пагинация строит курсор. Рейтинг есть у каждого рецепта, а
+        INNER JOIN позволяет читать рецепты по индексу рейтинга.
+        """
+        field = RECIPE_ORDERINGS[value]
+        if LOOKUP_SEP in field:
+            queryset = queryset.filter(**{f"{field}__isnull": False})
+        return queryset.annotate(score=F(field)).order_by("-score", "-id")
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
@@ -28,8 +86,42 @@ class RecipeFilter(FilterSet):
 
 
 class IngredientsFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr="istartswith")
+    name = filters.CharFilter(method="search_by_name")
 
     class Meta:
         model = Ingredient
         fields = ("name", )
+
+    def search_by_name(self, queryset, name, value):
+        """Сначала ингредиенты, начинающиеся с value, затем содержащие его.
+
+        Префикс ищется по индексу с LIMIT. Поиск подстроки индексом
+        для 1-2 букв не ускоряется, поэтому выполняется, только если
+        совпадений по префиксу меньше INGREDIENTS_SEARCH_LIMIT.
+        Возвращается выборка без среза, к ней можно применять фильтры.
+        """
+        ids = list(
+            queryset.filter(name__istartswith=value)
+            .order_by("name")
+            .values_list("id", flat=True)[:INGREDIENTS_SEARCH_LIMIT]
+        )
+        if len(ids) < INGREDIENTS_SEARCH_LIMIT:
+            ids += (
+                queryset.filter(name__icontains=value)
+                .exclude(name__istartswith=value)
+                .order_by("name")
+                .values_list("id", flat=True)[
+                    :INGREDIENTS_SEARCH_LIMIT - len(ids)
+                ]
+            )
+        return (
+            queryset.filter(id__in=ids)
+            .annotate(
+                search_rank=Case(
+                    When(name__istartswith=value, then=Value(0)),
+                    default=Value(1),
+                    output_field=IntegerField(),
+                )
+            )
+            .order_by("search_rank", "name")
+        )
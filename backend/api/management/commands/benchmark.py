@@ -0,0 +1,157 @@
+import json
+import random
+import shutil
+import tempfile
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.benchmarks.data import generate
+from api.benchmarks.report import compare, summarize
+from api.benchmarks.scenarios import ANONYMOUS_SCENARIOS, SCENARIOS
+from recipes.versions import bump_version
+
+
+class QueryCounter:
+    """Счетчик SQL-запросов для connection.execute_wrapper."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def reset_versions():
+    # Кэши, собранные на откаченных данных, больше не должны читаться.
+    for name in ("recipes", "tags", "ingredients"):
+        bump_version(name)
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочные сценарии для всех эндпоинтов API на синтетических "
+        "данных: пропускная способность, p50/p95/p99 и число SQL-запросов "
+        "в формате json. Данные создаются в транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--recipes", type=int, default=5000)
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=200,
+            help="Количество замеряемых запросов в сценарии.",
+        )
+        parser.add_argument("--warmup", type=int, default=10)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--scenarios",
+            default=",".join(SCENARIOS),
+            help="Сценарии через запятую.",
+        )
+        parser.add_argument(
+            "--label", default="", help="Метка отчета, например коммит."
+        )
+        parser.add_argument("--output", help="Файл для отчета json.")
+        parser.add_argument(
+            "--compare", help="Отчет json, с которым сравнить результаты."
+        )
+
+    def run_scenario(self, name, data, options):
+        client = APIClient()
+        if name not in ANONYMOUS_SCENARIOS:
+            client.force_authenticate(data.user)
+        requests = SCENARIOS[name](
+            data, random.Random(f"{options['seed']}:{name}")
+        )
+        timings, queries, errors = [], [], 0
+        for number in range(options["warmup"] + options["requests"]):
+            method, url, payload = next(requests)
+            counter = QueryCounter()
+            started = time.perf_counter()
+            with connection.execute_wrapper(counter):
+                if method == "get":
+                    response = client.get(url)
+                else:
+                    response = getattr(client, method)(
+                        url, payload, format="json"
+                    )
+                if response.streaming:
+                    b"".join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+            if number < options["warmup"]:
+                continue
+            timings.append(elapsed * 1000)
+            queries.append(counter.count)
+            errors += response.status_code >= 400
+        return summarize(timings, queries, errors, sum(timings) / 1000)
+
+    def run(self, names, options):
+        results = {}
+        with transaction.atomic():
+            data = generate(
+                random.Random(options["seed"]),
+                options["users"],
+                options["recipes"],
+            )
+            reset_versions()
+            for name in names:
+                result = results[name] = self.run_scenario(
+                    name, data, options
+                )
+                self.stderr.write(
+                    f"{name}: {result['throughput']} запр/с, "
+                    f"p50={result['p50_ms']} мс, "
+                    f"p95={result['p95_ms']} мс, "
+                    f"p99={result['p99_ms']} мс, "
+                    f"SQL={result['queries_median']}, "
+                    f"ошибок={result['errors']}"
+                )
+            transaction.set_rollback(True)
+        return results
+
+    @override_settings(ALLOWED_HOSTS=["testserver"])
+    def handle(self, *args, **options):
+        names = options["scenarios"].split(",")
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Неизвестные сценарии: {', '.join(unknown)}")
+        if options["requests"] < 1:
+            raise CommandError("--requests должен быть больше нуля.")
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as file:
+                baseline = json.load(file)
+        report = {
+            "label": options["label"],
+            "created": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "django": django.get_version(),
+            "users": options["users"],
+            "recipes": options["recipes"],
+            "seed": options["seed"],
+        }
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                report["scenarios"] = self.run(names, options)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+            reset_versions()
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                file.write(output + "\n")
+        else:
+            self.stdout.write(output)
+        if baseline is not None:
+            for line in compare(baseline, report):
+                self.stderr.write(line)
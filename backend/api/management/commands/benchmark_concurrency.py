@@ -0,0 +1,143 @@
+import json
+import socket
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks.report import percentile
+
+
+DEFAULT_PATHS = (
+    "/api/recipes/",
+    "/api/tags/",
+    "/api/ingredients/?name=са",
+)
+
+
+def fetch(host, port, path, delay, timeout):
+    """GET-запрос медленного клиента: заголовки отправляются с паузой."""
+    started = time.perf_counter()
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(
+            f"GET {quote(path, safe='/?=&')} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n".encode()
+        )
+        if delay:
+            time.sleep(delay)
+        sock.sendall(b"Connection: close\r\n\r\n")
+        chunks = []
+        while True:
+            chunk = sock.recv(64 * 1024)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    status = int(b"".join(chunks).split(b" ", 2)[1])
+    return (time.perf_counter() - started) * 1000, status
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнение серверов под параллельной нагрузкой медленных клиентов, "
+        "например gunicorn (WSGI) и uvicorn (ASGI). Серверы запускаются "
+        "отдельно и указываются через --target имя=url."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target",
+            action="append",
+            required=True,
+            help="Сервер в виде имя=http://host:port, можно несколько.",
+        )
+        parser.add_argument("--concurrency", default="1,10,50,100,200")
+        parser.add_argument(
+            "--rounds",
+            type=int,
+            default=5,
+            help="Запросов на одного клиента на каждом уровне.",
+        )
+        parser.add_argument(
+            "--client-delay",
+            type=float,
+            default=0.1,
+            help="Пауза клиента при отправке заголовков, секунд.",
+        )
+        parser.add_argument("--timeout", type=float, default=30)
+        parser.add_argument("--path", action="append")
+        parser.add_argument("--output", help="Файл для отчета json.")
+
+    def run_level(self, host, port, paths, concurrency, options):
+        requests = [
+            paths[number % len(paths)]
+            for number in range(concurrency * options["rounds"])
+        ]
+        timings, errors = [], 0
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(
+                    fetch,
+                    host,
+                    port,
+                    path,
+                    options["client_delay"],
+                    options["timeout"],
+                )
+                for path in requests
+            ]
+            for future in futures:
+                try:
+                    elapsed, status = future.result()
+                except (OSError, ValueError, IndexError):
+                    errors += 1
+                    continue
+                if status >= 400:
+                    errors += 1
+                    continue
+                timings.append(elapsed)
+        elapsed = time.perf_counter() - started
+        if not timings:
+            return {"requests": len(requests), "errors": errors}
+        return {
+            "requests": len(requests),
+            "errors": errors,
+            "throughput": round(len(timings) / elapsed, 2),
+            "p50_ms": round(statistics.median(timings), 3),
+            "p95_ms": round(percentile(timings, 95), 3),
+            "p99_ms": round(percentile(timings, 99), 3),
+        }
+
+    def handle(self, *args, **options):
+        paths = options["path"] or DEFAULT_PATHS
+        levels = [int(level) for level in options["concurrency"].split(",")]
+        report = {
+            "client_delay": options["client_delay"],
+            "paths": list(paths),
+            "targets": {},
+        }
+        for target in options["target"]:
+            name, _, url = target.partition("=")
+            parts = urlsplit(url)
+            if not url or parts.scheme != "http" or not parts.hostname:
+                raise CommandError(f"Некорректный --target: {target}")
+            results = report["targets"][name] = {}
+            for concurrency in levels:
+                result = results[concurrency] = self.run_level(
+                    parts.hostname, parts.port or 80, paths, concurrency,
+                    options,
+                )
+                self.stderr.write(
+                    f"{name}, {concurrency} клиентов: "
+                    f"{result.get('throughput', 0)} запр/с, "
+                    f"p95={result.get('p95_ms', '—')} мс, "
+                    f"ошибок={result['errors']}"
+                )
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                file.write(output + "\n")
+        else:
+            self.stdout.write(output)
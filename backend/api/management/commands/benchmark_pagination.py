@@ -0,0 +1,101 @@
+import statistics
+import time
+from base64 import b64encode
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+from users.models import User
+
+
+BATCH_SIZE = 10_000
+
+
+def encode_cursor(position):
+    """Курсор в формате CursorPagination, указывающий на позицию id."""
+    return b64encode(urlencode({"p": position}).encode("ascii")).decode()
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнение постраничной и курсорной пагинации рецептов на "
+        "синтетической таблице. Данные создаются в транзакции и "
+        "откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recipes", type=int, default=1_000_000)
+        parser.add_argument("--limit", type=int, default=6)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument(
+            "--pages",
+            default="1,10,100,1000,10000,100000",
+            help="Номера страниц через запятую.",
+        )
+
+    def generate(self, count):
+        author = User.objects.create_user(
+            email="benchmark@foodgram.local",
+            username="benchmark",
+            first_name="Benchmark",
+            last_name="Benchmark",
+            password=None,
+        )
+        for start in range(0, count, BATCH_SIZE):
+            Recipe.objects.bulk_create(
+                Recipe(
+                    author=author,
+                    name=f"Рецепт {number}",
+                    text="Описание",
+                    cooking_time=1 + number % 60,
+                )
+                for number in range(start, min(count, start + BATCH_SIZE))
+            )
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE recipes_recipe")
+        return author
+
+    def measure(self, client, url, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.status_code
+        return statistics.median(timings)
+
+    @override_settings(ALLOWED_HOSTS=["testserver"])
+    def handle(self, *args, **options):
+        limit = options["limit"]
+        with transaction.atomic():
+            client = APIClient()
+            client.force_authenticate(self.generate(options["recipes"]))
+            ids = Recipe.objects.values_list("id", flat=True)
+            self.stdout.write(f"Рецептов: {ids.count()}, limit={limit}")
+            for page in map(int, options["pages"].split(",")):
+                offset = (page - 1) * limit
+                position = ids[offset:offset + 1].first()
+                if position is None:
+                    break
+                page_time = self.measure(
+                    client,
+                    f"/api/recipes/?page={page}&limit={limit}",
+                    options["repeat"],
+                )
+                # Курсор указывает на рецепт перед первым на странице.
+                cursor = encode_cursor(position + 1)
+                cursor_time = self.measure(
+                    client,
+                    f"/api/recipes/?cursor={cursor}&limit={limit}",
+                    options["repeat"],
+                )
+                self.stdout.write(
+                    f"Страница {page}: page={page_time:.2f} мс, "
+                    f"cursor={cursor_time:.2f} мс"
+                )
+            transaction.set_rollback(True)
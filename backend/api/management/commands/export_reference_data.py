@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.snapshots import REFERENCE_SNAPSHOTS
+
+
+class Command(BaseCommand):
+    help = "Запись json-файлов тегов и ингредиентов в REFERENCE_DATA_DIR."
+
+    def handle(self, *args, **options):
+        if not settings.REFERENCE_DATA_DIR:
+            raise CommandError("Не задан REFERENCE_DATA_DIR.")
+        for snapshot in REFERENCE_SNAPSHOTS.values():
+            snapshot.export()
+            self.stdout.write(f"{snapshot.name}: {len(snapshot.content)} байт")
@@ -0,0 +1,109 @@
+import threading
+from bisect import bisect_left
+
+from api.cache import response_cache_stats
+
+
+DURATION_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERIES_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (
+    256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304,
+)
+
+
+class Histogram:
+    """Гистограмма в формате Prometheus с меткой view.
+
+    Значения хранятся в памяти процесса: при нескольких воркерах
+    каждый из них отдает свои счетчики.
+    """
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, view, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(view)
+            if counts is None:
+                # Счетчики корзин, +Inf, сумма и количество.
+                counts = self.values[view] = [0] * (len(self.buckets) + 3)
+            counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} histogram"
+        with self.lock:
+            values = {
+                view: list(counts) for view, counts in self.values.items()
+            }
+        for view, counts in sorted(values.items()):
+            total = 0
+            bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, counts):
+                total += count
+                yield (
+                    f'{self.name}_bucket{{view="{view}",le="{bound}"}} '
+                    f"{total}"
+                )
+            yield f'{self.name}_sum{{view="{view}"}} {counts[-2]}'
+            yield f'{self.name}_count{{view="{view}"}} {counts[-1]}'
+
+
+request_duration = Histogram(
+    "foodgram_request_duration_seconds",
+    "Время обработки запроса.",
+    DURATION_BUCKETS,
+)
+db_duration = Histogram(
+    "foodgram_db_duration_seconds",
+    "Время SQL-запросов за один запрос.",
+    DURATION_BUCKETS,
+)
+db_queries = Histogram(
+    "foodgram_db_queries",
+    "Количество SQL-запросов за один запрос.",
+    QUERIES_BUCKETS,
+)
+render_duration = Histogram(
+    "foodgram_render_duration_seconds",
+    "Время рендеринга ответа.",
+    DURATION_BUCKETS,
+)
+response_size = Histogram(
+    "foodgram_response_size_bytes",
+    "Размер тела ответа.",
+    SIZE_BUCKETS,
+)
+HISTOGRAMS = (
+    request_duration,
+    db_duration,
+    db_queries,
+    render_duration,
+    response_size,
+)
+
+
+def render_metrics():
+    """Все метрики процесса в текстовом формате Prometheus."""
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render()
+    lines += [
+        "# HELP foodgram_response_cache_total Обращения к кэшу ответов.",
+        "# TYPE foodgram_response_cache_total counter",
+    ]
+    for result in ("hit", "miss"):
+        lines.append(
+            f'foodgram_response_cache_total{{result="{result}"}} '
+            f"{response_cache_stats[result]}"
+        )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,202 @@
+import asyncio
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from api.metrics import (
+    db_duration,
+    db_queries,
+    render_duration,
+    request_duration,
+    response_size,
+)
+
+
+def get_view_name(view_func, method):
+    """Имя вида для метрик: ViewSet.action или модуль.функция."""
+    cls = getattr(view_func, "cls", None)
+    if cls is None:
+        return f"{view_func.__module__}.{view_func.__name__}"
+    actions = getattr(view_func, "actions", None)
+    if actions is None:
+        return cls.__name__
+    return f"{cls.__name__}.{actions.get(method.lower(), method.lower())}"
+
+
+# Замеры текущего запроса. Контекст переходит в потоки sync_to_async и
+# пула БД, поэтому запросы считаются на соединении любого потока.
+current_metrics = ContextVar("current_metrics", default=None)
+
+
+def measure_query(execute, sql, params, many, context):
+    """execute_wrapper всех соединений: передаёт запрос замерам."""
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_query_metrics(connection, **kwargs):
+    if measure_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(measure_query)
+
+
+class RequestMetrics:
+    """Замеры одного запроса; считает SQL как execute_wrapper."""
+
+    def __init__(self):
+        self.view = "unresolved"
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.size = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+    def start_render(self, response):
+        # Асинхронные виды рендерят ответ сами, в потоке БД.
+        if response.is_rendered:
+            return
+        started = time.perf_counter()
+
+        def finish_render(response):
+            self.render_time += time.perf_counter() - started
+
+        response.add_post_render_callback(finish_render)
+
+    def get_server_timing(self):
+        total = (time.perf_counter() - self.started) * 1000
+        return (
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+            f"render;dur={self.render_time * 1000:.1f}, "
+            f"total;dur={total:.1f}"
+        )
+
+    def record(self):
+        request_duration.observe(
+            self.view, time.perf_counter() - self.started
+        )
+        db_duration.observe(self.view, self.db_time)
+        db_queries.observe(self.view, self.queries)
+        render_duration.observe(self.view, self.render_time)
+        response_size.observe(self.view, self.size)
+
+
+class MeasuredStream:
+    """Тело потокового ответа, завершающее замеры после отдачи."""
+
+    def __init__(self, content, metrics):
+        self.content = content
+        self.metrics = metrics
+        self.closed = False
+
+    def __iter__(self):
+        content = iter(self.content)
+        while True:
+            # Тело читается уже после выхода из middleware.
+            token = current_metrics.set(self.metrics)
+            try:
+                chunk = next(content, None)
+            finally:
+                current_metrics.reset(token)
+            if chunk is None:
+                return
+            self.metrics.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        # Ответ закрывается сервером и тогда, когда тело не читалось.
+        if not self.closed:
+            self.closed = True
+            self.metrics.record()
+
+
+class MetricsMiddleware:
+    """Количество и время SQL-запросов, время рендеринга и размер ответа.
+
+    Замеряется доля запросов METRICS_SAMPLE_RATE, для остальных
+    остаётся одна проверка контекста на SQL-запрос. Для замеренных
+    запросов добавляется заголовок Server-Timing, гистограммы по видам
+    отдаются на /metrics. Запросы потоковых ответов учитываются до
+    конца отдачи тела, но в Server-Timing попадает только время до
+    начала отдачи. Под ASGI middleware работает асинхронно и не
+    переводит обработку запросов в один поток.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Как в MiddlewareMixin: обработчик видит корутину.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+            self.process_template_response = (
+                self.async_process_template_response
+            )
+
+    def start(self, request):
+        """Замеры запроса, если он попал в выборку, иначе None."""
+        rate = settings.METRICS_SAMPLE_RATE
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return None
+        metrics = request.metrics = RequestMetrics()
+        return metrics
+
+    def finish(self, request, response, metrics):
+        match = request.resolver_match
+        if match is not None:
+            metrics.view = get_view_name(match.func, request.method)
+        response["Server-Timing"] = metrics.get_server_timing()
+        if response.streaming:
+            response.streaming_content = MeasuredStream(
+                response.streaming_content, metrics
+            )
+        else:
+            metrics.size = len(response.content)
+            metrics.record()
+        return response
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics = self.start(request)
+        if metrics is None:
+            return self.get_response(request)
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = self.start(request)
+        if metrics is None:
+            return await self.get_response(request)
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        metrics = getattr(request, "metrics", None)
+        if metrics is not None:
+            metrics.start_render(response)
+        return response
+
+    async def async_process_template_response(self, request, response):
+        return MetricsMiddleware.process_template_response(
+            self, request, response
+        )
@@ -1,5 +1,126 @@
-from rest_framework.pagination import PageNumberPagination
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connection
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+from api.cache import make_cache_key
+
+
+class CountPaginator(DjangoPaginator):
+    """Пагинатор, получающий общее число объектов от count_func."""
+
+    def __init__(self, object_list, per_page, count_func, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_func = count_func
+
+    @cached_property
+    def count(self):
+        return self.count_func(self.object_list)
+
+
+class LimitCursorPagination(CursorPagination):
+    """Курсорная пагинация по сортировке выборки, без COUNT(*)."""
+
+    page_size_query_param = "limit"
+
+    def get_ordering(self, request, queryset, view):
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        return tuple(ordering)
 
 
 class PageLimitPagination(PageNumberPagination):
+    """Постраничная пагинация; с параметром cursor - курсорная.
+
+    Курсорный режим не считает общее число объектов, и глубокие
+    страницы в нём не замедляются с ростом смещения.
+
+    В постраничном режиме count может браться из кэша на
+    PAGINATION_COUNT_CACHE_TIMEOUT секунд, а для выборок без фильтров
+    больше PAGINATION_COUNT_ESTIMATE_THRESHOLD строк - из статистики
+    PostgreSQL. Поле count_exact сообщает, точное ли это значение.
+    """
+
     page_size_query_param = "limit"
+    cursor_query_param = "cursor"
+    cursor_pagination_class = LimitCursorPagination
+    count_cache_timeout = settings.PAGINATION_COUNT_CACHE_TIMEOUT
+    count_estimate_threshold = settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD
+
+    cursor_pagination = None
+    count_exact = True
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            self.request = request
+            self.view = view
+            self.django_paginator_class = partial(
+                CountPaginator, count_func=self.get_count
+            )
+            return super().paginate_queryset(queryset, request, view)
+        self.cursor_pagination = self.cursor_pagination_class()
+        return self.cursor_pagination.paginate_queryset(
+            queryset, request, view
+        )
+
+    def get_count_cache_key(self):
+        params = sorted(
+            (key, values)
+            for key, values in self.request.query_params.lists()
+            if key not in (self.page_query_param, self.page_size_query_param)
+        )
+        return make_cache_key(
+            "count", self.request.path, self.request.user.id, params
+        )
+
+    def get_estimated_count(self, queryset):
+        """Оценка числа строк таблицы по статистике PostgreSQL."""
+        if (
+            not self.count_estimate_threshold
+            or connection.vendor != "postgresql"
+            or queryset.query.where
+        ):
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class "
+                "WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < self.count_estimate_threshold:
+            return None
+        return row[0]
+
+    def get_count(self, queryset):
+        self.count_exact = False
+        count = self.get_estimated_count(queryset)
+        if count is not None:
+            return count
+        if self.count_cache_timeout:
+            key = self.get_count_cache_key()
+            count = cache.get(key)
+            if count is not None:
+                return count
+        self.count_exact = True
+        count = queryset.count()
+        if self.count_cache_timeout:
+            cache.set(key, count, self.count_cache_timeout)
+        return count
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.get_paginated_response(data)
+        return Response(
+            {
+                "count": self.page.paginator.count,
+                "count_exact": self.count_exact,
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
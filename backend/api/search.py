@@ -0,0 +1,104 @@
+import hashlib
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+from api.filters import INGREDIENTS_SEARCH_LIMIT
+from recipes.models import Ingredient
+from recipes.versions import get_version
+
+
+INGREDIENTS_INDEX_MAX_AGE = 5 * 60
+INGREDIENTS_RENDERED_CACHE_SIZE = 512
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Названия хранятся в отсортированном массиве, префикс ищется
+    бинарным поиском. Индекс перестраивается, когда меняется версия
+    ингредиентов или истекает INGREDIENTS_INDEX_MAX_AGE секунд.
+    digest - хэш содержимого индекса, одинаковый во всех процессах.
+    Готовые json-ответы для частых префиксов хранятся в LRU-кэше.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.digest = None
+        self.built_at = 0
+        self.keys = []
+        self.items = []
+        self.rendered = OrderedDict()
+
+    def is_fresh(self, version):
+        return version == self.version and (
+            time.monotonic() - self.built_at < INGREDIENTS_INDEX_MAX_AGE
+        )
+
+    def refresh(self, wait=True):
+        """Перестройка устаревшего индекса.
+
+        С wait=False не ждёт перестройки, начатой другим потоком, и
+        возвращает False: индекс пока устарел.
+        """
+        version = get_version("ingredients")
+        if self.is_fresh(version):
+            return True
+        if not self.lock.acquire(blocking=wait):
+            return False
+        try:
+            if self.is_fresh(version):
+                return True
+            items = sorted(
+                Ingredient.objects.values("id", "name", "measurement_unit"),
+                key=lambda item: (item["name"].casefold(), item["id"]),
+            )
+            self.keys = [item["name"].casefold() for item in items]
+            self.items = items
+            self.digest = hashlib.sha1(
+                json.dumps(items, sort_keys=True).encode()
+            ).hexdigest()
+            self.rendered = OrderedDict()
+            self.built_at = time.monotonic()
+            self.version = version
+        finally:
+            self.lock.release()
+        return True
+
+    def search(self, name):
+        """Сначала ингредиенты, начинающиеся с name, затем содержащие его."""
+        keys, items = self.keys, self.items
+        prefix = name.casefold()
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + chr(0x10FFFF), start)
+        result = items[start:min(end, start + INGREDIENTS_SEARCH_LIMIT)]
+        if len(result) == INGREDIENTS_SEARCH_LIMIT:
+            return result
+        for key, item in zip(keys, items):
+            if prefix in key and not key.startswith(prefix):
+                result.append(item)
+                if len(result) == INGREDIENTS_SEARCH_LIMIT:
+                    break
+        return result
+
+    def render(self, name):
+        """Json-ответ на запрос автодополнения."""
+        self.refresh()
+        with self.lock:
+            content = self.rendered.get(name)
+            if content is not None:
+                self.rendered.move_to_end(name)
+                return content
+            content = json.dumps(
+                self.search(name), ensure_ascii=False, separators=(",", ":")
+            ).encode()
+            self.rendered[name] = content
+            if len(self.rendered) > INGREDIENTS_RENDERED_CACHE_SIZE:
+                self.rendered.popitem(last=False)
+        return content
+
+
+ingredient_index = IngredientIndex()
@@ -1,31 +1,101 @@
 import base64
+import binascii
 
-from django.core.files.base import ContentFile
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
 from users.models import Follow, User
+from recipes.images import get_srcset
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
     RecipeIngredient,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
 )
 
+IMAGE_FORMATS = {"JPEG", "PNG", "GIF", "WEBP"}
+DATA_URI_HEADER_MAX_LENGTH = 64
+# Кратно 4, чтобы каждая часть декодировалась отдельно.
+BASE64_CHUNK_SIZE = 64 * 1024
+
+
+def get_recipes_limit(request):
+    """Значение параметра recipes_limit из запроса."""
+    if request is None:
+        return None
+    recipes_limit = request.query_params.get("recipes_limit")
+    if not recipes_limit:
+        return None
+    if not recipes_limit.isdigit():
+        raise serializers.ValidationError(
+            {"recipes_limit": "Должно быть неотрицательным целым числом"}
+        )
+    return int(recipes_limit)
+
+
+def get_image_srcset(recipe, request):
+    """srcset уменьшенных копий картинки по форматам."""
+    def build_url(path):
+        url = default_storage.url(path)
+        return request.build_absolute_uri(url) if request else url
+
+    return get_srcset(recipe, build_url)
+
 
 class Base64ImageField(serializers.ImageField):
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith("data:image"):
-            format, imgstr = data.split(";base64,")
-            ext = format.split("/")[-1]
+    """Картинка в data URI.
 
-            data = ContentFile(base64.b64decode(imgstr), name="temp." + ext)
+    base64 декодируется частями во временный файл, поэтому в памяти не
+    появляется вторая копия картинки; размер проверяется до декодирования.
+    """
 
-        return super().to_internal_value(data)
+    default_error_messages = {
+        "max_size": "Размер картинки больше {max_size} байт.",
+        "invalid_format": "Поддерживаются картинки JPEG, PNG, GIF и WebP.",
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith("data:image"):
+            data = self.decode(data)
+        image = super().to_internal_value(data)
+        if image.image.format not in IMAGE_FORMATS:
+            self.fail("invalid_format")
+        return image
+
+    def decode(self, data):
+        start = data.find(";base64,", 0, DATA_URI_HEADER_MAX_LENGTH)
+        if start == -1:
+            self.fail("invalid_image")
+        ext = data[:start].split("/")[-1]
+        start += len(";base64,")
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if (len(data) - start) // 4 * 3 > max_size:
+            self.fail("max_size", max_size=max_size)
+        file = TemporaryUploadedFile(
+            "temp." + ext, "image/" + ext, 0, None
+        )
+        try:
+            for offset in range(start, len(data), BASE64_CHUNK_SIZE):
+                file.write(
+                    base64.b64decode(
+                        data[offset:offset + BASE64_CHUNK_SIZE]
+                    )
+                )
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail("invalid_image")
+        file.size = file.tell()
+        file.seek(0)
+        return file
 
 
 class UserGetSerializer(UserSerializer):
@@ -44,13 +114,27 @@ class UserGetSerializer(UserSerializer):
             "is_subscribed",
         )
 
+    def get_subscriptions(self):
+        """Id авторов, на которых подписан пользователь.
+
+        Загружаются один раз и сохраняются в общем контексте,
+        так что вложенные сериализаторы не делают запрос на каждый объект.
+        """
+        if "subscriptions" not in self.context:
+            self.context["subscriptions"] = set(
+                self.context["request"].user.follower.values_list(
+                    "author_id", flat=True
+                )
+            )
+        return self.context["subscriptions"]
+
     def get_is_subscribed(self, author):
         """Проверка на наличие подписки."""
         request = self.context.get("request")
-        return (
+        return bool(
             request
             and request.user.is_authenticated
-            and request.user.follower.filter(author=author).exists()
+            and author.id in self.get_subscriptions()
         )
 
 
@@ -101,16 +185,20 @@ class FollowSerializer(serializers.ModelSerializer):
 class RecipeCutSerializer(serializers.ModelSerializer):
     """Сериализатор для краткой информации по рецепту"""
 
+    image_srcset = serializers.SerializerMethodField(read_only=True)
+
     class Meta:
         model = Recipe
-        fields = ("id", "name", "cooking_time", "image")
+        fields = ("id", "name", "cooking_time", "image", "image_srcset")
+
+    def get_image_srcset(self, obj):
+        return get_image_srcset(obj, self.context.get("request"))
 
 
 class FollowGetSerializer(UserGetSerializer):
     """Сериализатор для гет подписок."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -123,23 +211,21 @@ class FollowGetSerializer(UserGetSerializer):
             "is_subscribed",
             "recipes",
             "recipes_count",
+            "followers_count",
         )
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
     def get_recipes(self, obj):
-        request = self.context.get("request")
-        recipes_limit = None
-        if request:
-            recipes_limit = request.query_params.get("recipes_limit")
-        recipes = obj.recipes.all()
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
-            serializer = RecipeCutSerializer(
-                recipes, many=True, read_only=True
-            )
-            return serializer.data
+        if hasattr(obj, "recipes_preview"):
+            recipes = obj.recipes_preview
+        else:
+            recipes = obj.recipes.all()
+            recipes_limit = get_recipes_limit(self.context.get("request"))
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
+        serializer = RecipeCutSerializer(
+            recipes, many=True, read_only=True
+        )
+        return serializer.data
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -147,7 +233,7 @@ class TagSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Tag
-        fields = "__all__"
+        fields = ("id", "name", "color", "slug")
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -155,7 +241,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Ingredient
-        fields = "__all__"
+        fields = ("id", "name", "measurement_unit")
 
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
@@ -182,19 +268,29 @@ class RecipeGetSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    image_srcset = serializers.SerializerMethodField(read_only=True)
 
     def get_is_favorited(self, obj):
+        """Берём аннотацию из вьюсета, иначе проверяем запросом."""
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
         user = self.context.get("request").user
         if user.is_authenticated:
             return user.favorite.filter(recipe=obj).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        """Берём аннотацию из вьюсета, иначе проверяем запросом."""
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
         user = self.context.get("request").user
         if user.is_authenticated:
             return user.cart.filter(recipe=obj).exists()
         return False
 
+    def get_image_srcset(self, obj):
+        return get_image_srcset(obj, self.context.get("request"))
+
     class Meta:
         model = Recipe
         fields = (
@@ -206,8 +302,11 @@ class RecipeGetSerializer(serializers.ModelSerializer):
             "is_favorited",
             "is_in_shopping_cart",
             "image",
+            "image_srcset",
             "text",
             "cooking_time",
+            "favorites_count",
+            "carts_count",
         )
 
 
@@ -248,9 +347,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         RecipeIngredient.objects.bulk_create(
             [
                 RecipeIngredient(
-                    ingredient=get_object_or_404(
-                        Ingredient, id=ingredient_data["id"]
-                    ),
+                    ingredient_id=ingredient_data["id"],
                     recipe=instance,
                     amount=ingredient_data["amount"],
                 )
@@ -258,32 +355,108 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             ]
         )
 
-    def validate(self, data):
-        inrgedients_ids = [ing["id"] for ing in data.get("ingredients")]
+    def update_ingredients(self, ingredients, instance):
+        """Изменение только тех ингредиентов, которые отличаются."""
+        # Ингредиенты читаются заново после блокировки рецепта,
+        # а не из предзагруженных get_object.
+        ShoppingListItem.objects.lock_recipe(instance.id)
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in RecipeIngredient.objects.filter(
+                recipe=instance
+            )
+        }
+        previous_amounts = {
+            ingredient_id: recipe_ingredient.amount
+            for ingredient_id, recipe_ingredient in current.items()
+        }
+        amounts = {
+            ingredient_data["id"]: ingredient_data["amount"]
+            for ingredient_data in ingredients
+        }
+        changed = []
+        for ingredient_id, recipe_ingredient in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != recipe_ingredient.amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        removed_ids = current.keys() - amounts.keys()
+        if removed_ids:
+            instance.recipeingredients.filter(
+                ingredient_id__in=removed_ids
+            ).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ["amount"])
+        self.create_ingredients(
+            [
+                ingredient_data
+                for ingredient_data in ingredients
+                if ingredient_data["id"] not in current
+            ],
+            instance,
+        )
+        # bulk_update и bulk_create не отправляют сигналов, поэтому
+        # списки покупок для них меняются здесь; удалённые ингредиенты
+        # вычитает сигнал post_delete.
+        ShoppingListItem.objects.change_recipe(
+            instance.id,
+            {
+                ingredient_id: amount - previous_amounts.get(ingredient_id, 0)
+                for ingredient_id, amount in amounts.items()
+            },
+        )
+
+    def validate_ingredients(self, ingredients):
+        """Проверка ингредиентов одним запросом к БД."""
+        inrgedients_ids = [ing["id"] for ing in ingredients]
         unique_inrgedients_ids = set(inrgedients_ids)
         if len(unique_inrgedients_ids) != len(inrgedients_ids):
             raise serializers.ValidationError(
                 "Ингредиенты повторяются"
             )
-        return data
-
+        existing_ids = set(
+            Ingredient.objects.filter(
+                id__in=unique_inrgedients_ids
+            ).values_list("id", flat=True)
+        )
+        missing_ids = sorted(unique_inrgedients_ids - existing_ids)
+        if missing_ids:
+            raise serializers.ValidationError(
+                "Ингредиенты не найдены: "
+                + ", ".join(str(id) for id in missing_ids)
+            )
+        return ingredients
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            # Хранилище перемещает временный файл, закрываем его сразу.
+            image = self.validated_data.get("image")
+            if image is not None:
+                image.close()
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop("ingredients")
         instance = super().create(validated_data)
         self.create_ingredients(ingredients, instance)
         return instance
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop("ingredients")
-        instance.ingredients.clear()
+        ingredients = validated_data.pop("ingredients", None)
         super().update(instance, validated_data)
-        self.create_ingredients(ingredients, instance)
-        instance.save()
+        if ingredients is not None:
+            self.update_ingredients(ingredients, instance)
         return instance
 
     def to_representation(self, instance):
         request = self.context.get("request")
         context = {"request": request}
+        prefetch_related_objects(
+            [instance], "recipeingredients__ingredient", "tags"
+        )
         return RecipeGetSerializer(instance, context=context).data
 
 
@@ -301,3 +474,8 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
     class Meta:
         model = ShoppingCart
         fields = "__all__"
+
+    @transaction.atomic
+    def create(self, validated_data):
+        # Список покупок обновляется сигналом в этой же транзакции.
+        return super().create(validated_data)
@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from api.middleware import install_query_metrics
+from api.snapshots import REFERENCE_SNAPSHOTS
+from recipes.signals import reference_data_changed
+
+
+connection_created.connect(install_query_metrics)
+
+
+@receiver(reference_data_changed)
+def export_reference_data(sender, **kwargs):
+    transaction.on_commit(REFERENCE_SNAPSHOTS[sender].export)
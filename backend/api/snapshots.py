@@ -0,0 +1,108 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers, quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from api.serializers import IngredientSerializer, TagSerializer
+from recipes.models import Ingredient, Tag
+from recipes.versions import get_version
+
+
+REFERENCE_SNAPSHOT_MAX_AGE = 5 * 60
+
+
+class ReferenceSnapshot:
+    """Готовый json полного списка справочника в памяти процесса.
+
+    Хранится в исходном и сжатом gzip виде, пересобирается при смене
+    версии справочника. Если задан REFERENCE_DATA_DIR, файлы
+    <name>.json и <name>.json.gz пишутся на диск для отдачи через nginx.
+    """
+
+    def __init__(self, name, model, serializer_class):
+        self.name = name
+        self.model = model
+        self.serializer_class = serializer_class
+        self.lock = threading.Lock()
+        self.version = None
+        self.built_at = 0
+        self.content = b""
+        self.gzipped = b""
+        self.etag = None
+
+    def is_fresh(self, version):
+        return (
+            version == self.version
+            and time.monotonic() - self.built_at < REFERENCE_SNAPSHOT_MAX_AGE
+        )
+
+    def refresh(self):
+        version = get_version(self.name)
+        if self.is_fresh(version):
+            return
+        with self.lock:
+            if self.is_fresh(version):
+                return
+            content = JSONRenderer().render(
+                self.serializer_class(self.model.objects.all(), many=True).data
+            )
+            self.content = content
+            self.gzipped = gzip.compress(content)
+            self.etag = hashlib.sha1(content).hexdigest()
+            self.built_at = time.monotonic()
+            self.version = version
+
+    def accepts_gzip(self, request):
+        return "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", "")
+
+    def get_etag(self, request):
+        """Отдельный строгий ETag для каждого варианта кодирования."""
+        self.refresh()
+        if self.accepts_gzip(request):
+            return quote_etag(f"{self.etag}-gzip")
+        return quote_etag(self.etag)
+
+    def get_response(self, request):
+        self.refresh()
+        if self.accepts_gzip(request):
+            response = HttpResponse(
+                self.gzipped, content_type="application/json"
+            )
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = HttpResponse(
+                self.content, content_type="application/json"
+            )
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
+    def export(self):
+        directory = settings.REFERENCE_DATA_DIR
+        if not directory:
+            return
+        self.refresh()
+        os.makedirs(directory, exist_ok=True)
+        for filename, content in (
+            (f"{self.name}.json", self.content),
+            (f"{self.name}.json.gz", self.gzipped),
+        ):
+            path = os.path.join(directory, filename)
+            with open(f"{path}.tmp", "wb") as file:
+                file.write(content)
+            os.replace(f"{path}.tmp", path)
+
+
+tags_snapshot = ReferenceSnapshot("tags", Tag, TagSerializer)
+ingredients_snapshot = ReferenceSnapshot(
+    "ingredients", Ingredient, IngredientSerializer
+)
+REFERENCE_SNAPSHOTS = {
+    Tag: tags_snapshot,
+    Ingredient: ingredients_snapshot,
+}
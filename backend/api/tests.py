@@ -1,5 +1,66 @@
+import asyncio
+import base64
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
 from http import HTTPStatus
-from django.test import Client, TestCase
+from unittest import skipUnless
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (
+    Client,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.filters import (
+    INGREDIENTS_SEARCH_LIMIT,
+    RECIPE_ORDERINGS,
+    IngredientsFilter,
+)
+from api.middleware import MetricsMiddleware
+from api.pagination import PageLimitPagination
+from api.search import ingredient_index
+from api.serializers import IngredientSerializer, TagSerializer
+from api.views import TagViewSet
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipePopularity,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from recipes.versions import bump_version
+from users.models import Follow, User
 
 
 class FoodgramAPITestCase(TestCase):
@@ -10,3 +71,1806 @@ class FoodgramAPITestCase(TestCase):
         """Проверка доступности списка задач."""
         response = self.guest_client.get("/api/recipes/")
         self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+class IngredientSearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit="г")
+            for name in ("мука", "сахар", "мускат", "сахарная пудра",
+                         "тростниковый сахар", "соль")
+        )
+
+    def setUp(self):
+        bump_version("ingredients")
+
+    def test_prefix_matches_go_first(self):
+        """Совпадения по началу названия идут раньше остальных."""
+        response = self.client.get("/api/ingredients/?name=сах")
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            [ingredient["name"] for ingredient in response.json()],
+            ["сахар", "сахарная пудра", "тростниковый сахар"],
+        )
+
+    def test_search_results_are_capped(self):
+        """Размер выдачи ограничен."""
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"мука {i}", measurement_unit="г")
+            for i in range(INGREDIENTS_SEARCH_LIMIT)
+        )
+        bump_version("ingredients")
+        response = self.client.get("/api/ingredients/?name=мук")
+        self.assertEqual(len(response.json()), INGREDIENTS_SEARCH_LIMIT)
+
+    def test_search_sees_ingredient_changes(self):
+        """Индекс в памяти обновляется после изменения ингредиентов."""
+        self.client.get("/api/ingredients/?name=соль")
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/ingredients/?name=соль")
+        self.assertEqual(len(context.captured_queries), 0)
+        self.assertEqual(len(response.json()), 1)
+        Ingredient.objects.create(name="соль морская", measurement_unit="г")
+        response = self.client.get("/api/ingredients/?name=соль")
+        self.assertEqual(
+            [ingredient["name"] for ingredient in response.json()],
+            ["соль", "соль морская"],
+        )
+
+    def test_search_etag_follows_index_content(self):
+        """ETag поиска меняется вместе с содержимым индекса.
+
+        Индекс перестраивается и по возрасту, например после загрузки
+        ингредиентов в другом процессе, без смены версии.
+        """
+        etag = self.client.get("/api/ingredients/?name=сах")["ETag"]
+        ingredient_index.built_at = 0
+        self.assertEqual(
+            self.client.get("/api/ingredients/?name=сах")["ETag"], etag
+        )
+        Ingredient.objects.filter(name="сахар").update(name="сахарин")
+        ingredient_index.built_at = 0
+        response = self.client.get(
+            "/api/ingredients/?name=сах", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertIn(
+            "сахарин", [ingredient["name"] for ingredient in response.json()]
+        )
+
+    def test_search_during_rebuild_uses_filter(self):
+        """Пока индекс перестраивается, поиск идёт через фильтр в БД."""
+        self.client.get("/api/ingredients/?name=сах")
+        Ingredient.objects.create(name="сахар ванильный", measurement_unit="г")
+        with ingredient_index.lock:
+            response = self.client.get("/api/ingredients/?name=сах")
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotIn("ETag", response)
+        self.assertEqual(
+            [ingredient["name"] for ingredient in response.json()],
+            [
+                "сахар",
+                "сахар ванильный",
+                "сахарная пудра",
+                "тростниковый сахар",
+            ],
+        )
+
+    def search(self, name):
+        return list(
+            IngredientsFilter(
+                {"name": name}, queryset=Ingredient.objects.all()
+            ).qs.values_list("name", flat=True)
+        )
+
+    def test_filter_falls_back_to_substring(self):
+        """Фильтр ищет подстроку, только если префиксов не хватает."""
+        with CaptureQueriesContext(connection) as context:
+            names = self.search("сах")
+        self.assertEqual(
+            names, ["сахар", "сахарная пудра", "тростниковый сахар"]
+        )
+        self.assertEqual(len(context.captured_queries), 3)
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"сахар {i}", measurement_unit="г")
+            for i in range(INGREDIENTS_SEARCH_LIMIT)
+        )
+        with CaptureQueriesContext(connection) as context:
+            names = self.search("сах")
+        self.assertEqual(len(context.captured_queries), 2)
+        self.assertEqual(len(names), INGREDIENTS_SEARCH_LIMIT)
+        self.assertNotIn("тростниковый сахар", names)
+
+    def test_detail_ignores_search(self):
+        """Параметр поиска не ломает получение ингредиента по id."""
+        ingredient = Ingredient.objects.get(name="соль")
+        response = self.client.get(
+            f"/api/ingredients/{ingredient.id}/?name=с"
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.json()["name"], "соль")
+
+
+class AnonymousResponseCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email="author@test.ru",
+            username="author",
+            first_name="Автор",
+            last_name="Авторов",
+            password="password",
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name="Рецепт", text="Описание", cooking_time=5
+        )
+
+    def setUp(self):
+        caches["responses"].clear()
+
+    def test_anonymous_responses_are_cached(self):
+        """Повторный анонимный запрос обслуживается из кэша."""
+        for url in ("/api/recipes/", f"/api/recipes/{self.recipe.id}/"):
+            self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response["X-Cache"], "HIT")
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.assertFalse(
+                [
+                    query for query in context.captured_queries
+                    if "recipes_recipeingredient" in query["sql"]
+                ]
+            )
+
+    def test_changes_invalidate_cached_responses(self):
+        """Изменения рецепта и автора сбрасывают кэш."""
+        url = f"/api/recipes/{self.recipe.id}/"
+        self.client.get(url)
+        self.client.get("/api/recipes/")
+        self.recipe.name = "Новое название"
+        self.recipe.save()
+        self.assertEqual(self.client.get(url).json()["name"], "Новое название")
+        self.assertEqual(
+            self.client.get("/api/recipes/").json()["results"][0]["name"],
+            "Новое название",
+        )
+        self.author.first_name = "Новое имя"
+        self.author.save()
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["author"]["first_name"], "Новое имя")
+
+    def test_marks_do_not_invalidate_lists(self):
+        """Избранное сбрасывает кэш карточки, списки - по времени."""
+        url = f"/api/recipes/{self.recipe.id}/"
+        with patch("api.views.time") as clock:
+            clock.time.return_value = 0
+            self.client.get("/api/recipes/")
+            self.client.get(url)
+            Favorite.objects.create(user=self.author, recipe=self.recipe)
+            self.assertEqual(self.client.get(url).json()["favorites_count"], 1)
+            response = self.client.get("/api/recipes/")
+            self.assertEqual(response["X-Cache"], "HIT")
+            self.assertEqual(
+                response.json()["results"][0]["favorites_count"], 0
+            )
+            clock.time.return_value = settings.RECIPE_LIST_COUNTERS_MAX_AGE
+            response = self.client.get("/api/recipes/")
+            self.assertEqual(response["X-Cache"], "MISS")
+            self.assertEqual(
+                response.json()["results"][0]["favorites_count"], 1
+            )
+
+    @override_settings(RECIPE_LIST_COUNTERS_MAX_AGE=0)
+    def test_marks_invalidate_lists_without_max_age(self):
+        """Без задержки счётчиков избранное сразу сбрасывает списки."""
+        self.client.get("/api/recipes/")
+        Favorite.objects.create(user=self.author, recipe=self.recipe)
+        response = self.client.get("/api/recipes/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["results"][0]["favorites_count"], 1)
+
+    def test_authenticated_responses_are_not_cached(self):
+        """Ответы с персональными флагами не попадают в кэш."""
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.get("/api/recipes/")
+        self.assertFalse(response.has_header("X-Cache"))
+
+
+class ConditionalGetTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email="author@test.ru",
+            username="author",
+            first_name="Автор",
+            last_name="Авторов",
+            password="password",
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name="Рецепт", text="Описание", cooking_time=5
+        )
+        Tag.objects.create(name="Завтрак", color="#E26C2D", slug="lunch")
+        Ingredient.objects.create(name="соль", measurement_unit="г")
+
+    def assert_not_modified(self, url, client=None):
+        client = client or self.client
+        response = client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        etag = response["ETag"]
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        return etag
+
+    def test_read_endpoints_answer_not_modified(self):
+        """Эндпоинты чтения отвечают 304 на совпавший ETag.
+
+        Last-Modified есть только у отдельных объектов.
+        """
+        tag = Tag.objects.get()
+        ingredient = Ingredient.objects.get()
+        for url, has_last_modified in (
+            ("/api/recipes/", False),
+            (f"/api/recipes/{self.recipe.id}/", True),
+            ("/api/tags/", False),
+            (f"/api/tags/{tag.id}/", True),
+            ("/api/ingredients/", False),
+            ("/api/ingredients/?name=со", False),
+            (f"/api/ingredients/{ingredient.id}/", True),
+        ):
+            with self.subTest(url=url):
+                self.assert_not_modified(url)
+                self.assertEqual(
+                    self.client.get(url).has_header("Last-Modified"),
+                    has_last_modified,
+                )
+
+    def test_list_validators_do_not_scan_recipes(self):
+        """304 и ответ из кэша для списка не читают таблицу рецептов."""
+        caches["responses"].clear()
+        url = "/api/recipes/?tags=lunch"
+        etag = self.client.get(url)["ETag"]
+        for headers in ({}, {"HTTP_IF_NONE_MATCH": etag}):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, **headers)
+            self.assertIn(
+                response.status_code,
+                (HTTPStatus.OK, HTTPStatus.NOT_MODIFIED),
+            )
+            self.assertEqual(context.captured_queries, [])
+
+    def test_deleted_recipe_changes_list_etag(self):
+        """После удаления рецепта список не считается неизменённым."""
+        other = Recipe.objects.create(
+            author=self.author, name="Другой", text="Описание",
+            cooking_time=5,
+        )
+        response = self.client.get("/api/recipes/")
+        etag = response["ETag"]
+        other.delete()
+        for headers in (
+            {"HTTP_IF_NONE_MATCH": etag},
+            {"HTTP_IF_MODIFIED_SINCE": http_date()},
+        ):
+            response = self.client.get("/api/recipes/", **headers)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.assertEqual(response.json()["count"], 1)
+
+    def test_etag_changes_with_data(self):
+        """ETag меняется при изменении рецепта и избранного."""
+        url = f"/api/recipes/{self.recipe.id}/"
+        etag = self.assert_not_modified(url)
+        self.recipe.text = "Новое описание"
+        self.recipe.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        client = APIClient()
+        client.force_authenticate(self.author)
+        etag = self.assert_not_modified(url, client)
+        Favorite.objects.create(user=self.author, recipe=self.recipe)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response.data["is_favorited"])
+        self.assertFalse(response.has_header("Last-Modified"))
+
+
+class ReferenceDataTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.create(name="Завтрак", color="#E26C2D", slug="lunch")
+        Ingredient.objects.create(name="соль", measurement_unit="г")
+
+    def setUp(self):
+        # Откат транзакции теста не меняет версии справочников.
+        bump_version("tags")
+        bump_version("ingredients")
+
+    def test_reference_lists_are_served_from_memory(self):
+        """Полные списки тегов и ингредиентов не обращаются к БД."""
+        for url, expected in (
+            ("/api/tags/", TagSerializer(Tag.objects.all(), many=True)),
+            (
+                "/api/ingredients/",
+                IngredientSerializer(Ingredient.objects.all(), many=True),
+            ),
+        ):
+            with self.subTest(url=url):
+                self.client.get(url)
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(url)
+                self.assertEqual(len(context.captured_queries), 0)
+                self.assertEqual(response.json(), expected.data)
+                response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+                self.assertEqual(response["Content-Encoding"], "gzip")
+                self.assertEqual(
+                    json.loads(gzip.decompress(response.content)),
+                    expected.data,
+                )
+
+    def test_reference_lists_are_rebuilt_on_changes(self):
+        """Изменение справочника пересобирает готовый ответ и файлы."""
+        self.client.get("/api/tags/")
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(REFERENCE_DATA_DIR=directory):
+                with self.captureOnCommitCallbacks(execute=True):
+                    Tag.objects.create(
+                        name="Ужин", color="#49B64E", slug="dinner"
+                    )
+                with open(os.path.join(directory, "tags.json")) as file:
+                    self.assertEqual(len(json.load(file)), 2)
+        self.assertEqual(len(self.client.get("/api/tags/").json()), 2)
+
+
+class RecipeQueriesTestCase(TestCase):
+    RECIPES_COUNT = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="user@test.ru",
+            username="user",
+            first_name="Имя",
+            last_name="Фамилия",
+            password="password",
+        )
+        tags = [
+            Tag.objects.create(name="Завтрак", color="#E26C2D", slug="lunch"),
+            Tag.objects.create(name="Ужин", color="#49B64E", slug="dinner"),
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f"Продукт {i}", measurement_unit="г"
+            )
+            for i in range(3)
+        ]
+        for i in range(cls.RECIPES_COUNT):
+            author = User.objects.create_user(
+                email=f"author{i}@test.ru",
+                username=f"author{i}",
+                first_name="Автор",
+                last_name="Авторов",
+                password="password",
+            )
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f"Рецепт {i}",
+                text="Описание",
+                cooking_time=10,
+            )
+            recipe.tags.set(tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=i + 1
+                )
+                for ingredient in ingredients
+            )
+            if i % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if i % 3:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+            if i % 4:
+                Follow.objects.create(user=cls.user, author=author)
+        ShoppingListItem.objects.rebuild()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, url, table=""):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        queries = [
+            query for query in context.captured_queries
+            if table in query["sql"]
+        ]
+        return len(queries), response
+
+    def test_recipe_flags_queries_do_not_depend_on_page_size(self):
+        """Флаги избранного и корзины считаются одним запросом."""
+        for table in ("recipes_favorite", "recipes_shoppingcart"):
+            small, _ = self.count_queries("/api/recipes/?limit=1", table)
+            large, response = self.count_queries(
+                f"/api/recipes/?limit={self.RECIPES_COUNT}", table
+            )
+            self.assertEqual(small, large)
+        self.assertEqual(len(response.data["results"]), self.RECIPES_COUNT)
+
+    def test_recipe_list_queries_do_not_depend_on_page_size(self):
+        """Авторы и подписки не дают запросов на каждый рецепт."""
+        small, _ = self.count_queries("/api/recipes/?limit=1")
+        large, _ = self.count_queries(
+            f"/api/recipes/?limit={self.RECIPES_COUNT}"
+        )
+        self.assertEqual(small, large)
+
+    def test_cursor_pagination(self):
+        """Курсорная пагинация обходит все рецепты без COUNT(*)."""
+        url = "/api/recipes/?cursor=&limit=3"
+        ids = []
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.assertNotIn("count", response.data)
+            self.assertFalse(
+                [
+                    query for query in context.captured_queries
+                    if "COUNT(" in query["sql"]
+                    and 'FROM "recipes_recipe"' in query["sql"]
+                ]
+            )
+            ids += [recipe["id"] for recipe in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(
+            ids, list(Recipe.objects.values_list("id", flat=True))
+        )
+
+    def test_count_is_exact_by_default(self):
+        """По умолчанию count в ответе точный."""
+        response = self.client.get("/api/recipes/")
+        self.assertEqual(response.data["count"], self.RECIPES_COUNT)
+        self.assertTrue(response.data["count_exact"])
+
+    def test_cached_count(self):
+        """Кэшированный count помечается как неточный."""
+        cache.clear()
+        with patch.object(PageLimitPagination, "count_cache_timeout", 60):
+            url = "/api/recipes/?is_favorited=1&limit=2&page=1"
+            response = self.client.get(url)
+            self.assertTrue(response.data["count_exact"])
+            count = response.data["count"]
+            Favorite.objects.create(
+                user=self.user, recipe=Recipe.objects.last()
+            )
+            response = self.client.get(url.replace("page=1", "page=2"))
+            self.assertEqual(response.data["count"], count)
+            self.assertFalse(response.data["count_exact"])
+            response = self.client.get("/api/recipes/?is_favorited=0")
+            self.assertTrue(response.data["count_exact"])
+
+    def test_filter_by_several_tags(self):
+        """Рецепт с несколькими тегами попадает в выдачу один раз."""
+        url = "/api/recipes/?tags=lunch&tags=dinner&tags=unknown&limit=4"
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.data["count"], self.RECIPES_COUNT)
+            ids += [recipe["id"] for recipe in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(len(ids), self.RECIPES_COUNT)
+        self.assertEqual(len(set(ids)), self.RECIPES_COUNT)
+        response = self.client.get("/api/recipes/?tags=unknown")
+        self.assertEqual(response.data["count"], 0)
+
+    def test_recipe_list_flags(self):
+        """Флаги избранного и корзины совпадают с данными в БД."""
+        response = self.client.get(
+            f"/api/recipes/?limit={self.RECIPES_COUNT}"
+        )
+        favorited = set(
+            self.user.favorite.values_list("recipe_id", flat=True)
+        )
+        in_cart = set(self.user.cart.values_list("recipe_id", flat=True))
+        following = set(
+            self.user.follower.values_list("author_id", flat=True)
+        )
+        for recipe in response.data["results"]:
+            self.assertEqual(
+                recipe["author"]["is_subscribed"],
+                recipe["author"]["id"] in following,
+            )
+            self.assertEqual(
+                recipe["is_favorited"], recipe["id"] in favorited
+            )
+            self.assertEqual(
+                recipe["is_in_shopping_cart"], recipe["id"] in in_cart
+            )
+
+    def download(self, format=None):
+        url = "/api/recipes/download_shopping_cart/"
+        if format:
+            url += f"?format={format}"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode()
+
+    def expected_cart(self):
+        amount = sum(
+            i + 1 for i in range(self.RECIPES_COUNT) if i % 3
+        )
+        return [(f"Продукт {i}", amount, "г") for i in range(3)]
+
+    def test_download_shopping_cart_txt(self):
+        """Список покупок по умолчанию выгружается текстом."""
+        response, content = self.download()
+        self.assertEqual(response["Content-Type"], "text/plain")
+        self.assertIn('filename="shopping_cart.txt"',
+                      response["Content-Disposition"])
+        lines = content.split("\n")
+        self.assertEqual(lines[0], "Список необходимых ингредиентов:")
+        self.assertEqual(
+            lines[1:],
+            [f"{name} - {amount} {unit}"
+             for name, amount, unit in self.expected_cart()],
+        )
+
+    def test_download_shopping_cart_csv(self):
+        """Список покупок выгружается в csv."""
+        response, content = self.download("csv")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0], ["name", "amount", "measurement_unit"])
+        self.assertEqual(
+            rows[1:],
+            [[name, str(amount), unit]
+             for name, amount, unit in self.expected_cart()],
+        )
+
+    def test_download_shopping_cart_json(self):
+        """Список покупок выгружается в json."""
+        response, content = self.download("json")
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(
+            json.loads(content),
+            [
+                {"name": name, "amount": amount, "measurement_unit": unit}
+                for name, amount, unit in self.expected_cart()
+            ],
+        )
+
+    def test_download_shopping_cart_errors_json(self):
+        """Ошибки выгрузки отдаются в json при любом формате."""
+        self.client.force_authenticate(None)
+        for format in ("", "?format=txt", "?format=csv"):
+            with self.subTest(format=format):
+                response = self.client.get(
+                    "/api/recipes/download_shopping_cart/" + format
+                )
+                self.assertEqual(
+                    response.status_code, HTTPStatus.UNAUTHORIZED
+                )
+                self.assertEqual(
+                    response["Content-Type"], "application/json"
+                )
+                self.assertIn("detail", json.loads(response.content))
+
+
+class SubscriptionsQueriesTestCase(TestCase):
+    AUTHORS_COUNT = 5
+    RECIPES_PER_AUTHOR = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="user@test.ru",
+            username="user",
+            first_name="Имя",
+            last_name="Фамилия",
+            password="password",
+        )
+        for i in range(cls.AUTHORS_COUNT):
+            author = User.objects.create_user(
+                email=f"author{i}@test.ru",
+                username=f"author{i}",
+                first_name="Автор",
+                last_name="Авторов",
+                password="password",
+            )
+            Follow.objects.create(user=cls.user, author=author)
+            Recipe.objects.bulk_create(
+                Recipe(
+                    author=author,
+                    name=f"Рецепт {j}",
+                    text="Описание",
+                    cooking_time=10,
+                )
+                for j in range(cls.RECIPES_PER_AUTHOR)
+            )
+        # bulk_create не отправляет сигналы, которые ведут счётчики.
+        call_command("reconcile_counters", stdout=io.StringIO())
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return len(context.captured_queries), response
+
+    def test_subscriptions_queries_are_constant(self):
+        """Число запросов не зависит от страницы и recipes_limit."""
+        small, _ = self.count_queries(
+            "/api/users/subscriptions/?limit=1&recipes_limit=1"
+        )
+        large, response = self.count_queries(
+            f"/api/users/subscriptions/?limit={self.AUTHORS_COUNT}"
+            f"&recipes_limit={self.RECIPES_PER_AUTHOR}"
+        )
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.data["results"]), self.AUTHORS_COUNT)
+
+    def test_subscriptions_recipes_preview(self):
+        """В подписках выводятся последние рецепты и их общее число."""
+        response = self.client.get(
+            "/api/users/subscriptions/?recipes_limit=2"
+        )
+        for author in response.data["results"]:
+            expected = list(
+                Recipe.objects.filter(author_id=author["id"])
+                .values_list("id", flat=True)[:2]
+            )
+            self.assertEqual(
+                [recipe["id"] for recipe in author["recipes"]], expected
+            )
+            self.assertEqual(
+                author["recipes_count"], self.RECIPES_PER_AUTHOR
+            )
+            self.assertTrue(author["is_subscribed"])
+
+    def test_subscriptions_invalid_recipes_limit(self):
+        """Некорректный recipes_limit возвращает ошибку валидации."""
+        response = self.client.get(
+            "/api/users/subscriptions/?recipes_limit=abc"
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+IMAGE = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA"
+    "DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+)
+OTHER_IMAGE = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAA"
+    "DElEQVR4nGP4z8AAAAMBAQDJ/pLvAAAAAElFTkSuQmCC"
+)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, MEDIA_GC_GRACE_PERIOD=0)
+class RecipeWriteTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="user@test.ru",
+            username="user",
+            first_name="Имя",
+            last_name="Фамилия",
+            password="password",
+        )
+        cls.tag = Tag.objects.create(
+            name="Завтрак", color="#E26C2D", slug="lunch"
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"Продукт {i}", measurement_unit="г")
+            for i in range(30)
+        )
+        cls.ingredients = list(Ingredient.objects.all())
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def recipe_data(self, ingredients, **kwargs):
+        data = {
+            "name": "Рецепт",
+            "text": "Описание",
+            "cooking_time": 10,
+            "image": IMAGE,
+            "tags": [self.tag.id],
+            "ingredients": [
+                {"id": ingredient.id, "amount": amount}
+                for ingredient, amount in ingredients
+            ],
+        }
+        data.update(kwargs)
+        return data
+
+    def create_recipe(self, ingredients):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                "/api/recipes/", self.recipe_data(ingredients), format="json"
+            )
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        return len(context.captured_queries), response
+
+    def test_create_queries_do_not_depend_on_ingredients(self):
+        """Число запросов при создании не зависит от числа ингредиентов."""
+        small, _ = self.create_recipe([(self.ingredients[0], 1)])
+        large, response = self.create_recipe(
+            [(ingredient, 2) for ingredient in self.ingredients]
+        )
+        self.assertEqual(small, large)
+        self.assertEqual(
+            len(response.data["ingredients"]), len(self.ingredients)
+        )
+
+    def test_create_with_unknown_ingredients(self):
+        """Несуществующие ингредиенты перечисляются в ошибке."""
+        unknown = self.ingredients[-1].id + 1
+        data = self.recipe_data([(self.ingredients[0], 1)])
+        data["ingredients"] += [
+            {"id": unknown, "amount": 1},
+            {"id": unknown + 1, "amount": 1},
+        ]
+        response = self.client.post("/api/recipes/", data, format="json")
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn(
+            f"{unknown}, {unknown + 1}", str(response.data["ingredients"])
+        )
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_update_changes_only_modified_ingredients(self):
+        """Неизменённые ингредиенты рецепта не пересоздаются."""
+        first, second, third = self.ingredients[:3]
+        _, response = self.create_recipe([(first, 1), (second, 2)])
+        recipe = Recipe.objects.get(id=response.data["id"])
+        kept = recipe.recipeingredients.get(ingredient=first)
+        changed = recipe.recipeingredients.get(ingredient=second)
+        response = self.client.put(
+            f"/api/recipes/{recipe.id}/",
+            self.recipe_data([(first, 1), (second, 5), (third, 3)]),
+            format="json",
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            dict(
+                recipe.recipeingredients.values_list("ingredient_id", "amount")
+            ),
+            {first.id: 1, second.id: 5, third.id: 3},
+        )
+        self.assertTrue(
+            recipe.recipeingredients.filter(id=kept.id, amount=1).exists()
+        )
+        self.assertTrue(
+            recipe.recipeingredients.filter(id=changed.id, amount=5).exists()
+        )
+        self.client.put(
+            f"/api/recipes/{recipe.id}/",
+            self.recipe_data([(third, 3)]),
+            format="json",
+        )
+        self.assertEqual(
+            list(recipe.recipeingredients.values_list("ingredient_id")),
+            [(third.id,)],
+        )
+
+    def test_partial_update_keeps_ingredients(self):
+        """PATCH без ингредиентов не трогает ингредиенты рецепта."""
+        _, response = self.create_recipe([(self.ingredients[0], 1)])
+        recipe = Recipe.objects.get(id=response.data["id"])
+        ids = list(recipe.recipeingredients.values_list("id", flat=True))
+        response = self.client.patch(
+            f"/api/recipes/{recipe.id}/", {"text": "Новое"}, format="json"
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.data["text"], "Новое")
+        self.assertEqual(
+            list(recipe.recipeingredients.values_list("id", flat=True)), ids
+        )
+
+    def assert_shopping_list(self, expected):
+        self.assertEqual(
+            dict(
+                self.user.shopping_list.values_list("ingredient_id", "amount")
+            ),
+            {ingredient.id: amount for ingredient, amount in expected},
+        )
+        call_command(
+            "rebuild_shopping_lists", verify=True, stdout=io.StringIO()
+        )
+
+    def test_shopping_list_follows_cart_and_recipe_changes(self):
+        """Список покупок обновляется при изменении корзины и рецептов."""
+        first, second, third = self.ingredients[:3]
+        _, response = self.create_recipe([(first, 1), (second, 2)])
+        recipe_id = response.data["id"]
+        _, response = self.create_recipe([(first, 10)])
+        other_id = response.data["id"]
+        for id in (recipe_id, other_id):
+            response = self.client.post(f"/api/recipes/{id}/shopping_cart/")
+            self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assert_shopping_list([(first, 11), (second, 2)])
+        self.client.put(
+            f"/api/recipes/{recipe_id}/",
+            self.recipe_data([(first, 3), (third, 4)]),
+            format="json",
+        )
+        self.assert_shopping_list([(first, 13), (third, 4)])
+        response = self.client.delete(
+            f"/api/recipes/{other_id}/shopping_cart/"
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assert_shopping_list([(first, 3), (third, 4)])
+        response = self.client.delete(f"/api/recipes/{recipe_id}/")
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assert_shopping_list([])
+
+    def test_verify_shopping_lists(self):
+        """Команда проверки находит устаревшие списки покупок."""
+        _, response = self.create_recipe([(self.ingredients[0], 1)])
+        ShoppingCart.objects.create(
+            user=self.user, recipe_id=response.data["id"]
+        )
+        self.user.shopping_list.update(amount=5)
+        with self.assertRaises(CommandError):
+            call_command(
+                "rebuild_shopping_lists", verify=True, stdout=io.StringIO()
+            )
+        call_command("rebuild_shopping_lists", stdout=io.StringIO())
+        self.assert_shopping_list([(self.ingredients[0], 1)])
+
+    def test_shopping_list_follows_orm_changes(self):
+        """Список покупок обновляется и при изменениях мимо API."""
+        first, second, third = self.ingredients[:3]
+        author = User.objects.create_user(
+            email="author@test.ru", username="author", password="password"
+        )
+        recipes = [
+            Recipe.objects.create(
+                author=author, name=name, text="Описание", cooking_time=5
+            )
+            for name in ("Первый", "Второй")
+        ]
+        for recipe, ingredient, amount in (
+            (recipes[0], first, 1),
+            (recipes[0], second, 2),
+            (recipes[1], first, 10),
+        ):
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=amount
+            )
+        for recipe in recipes:
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        self.assert_shopping_list([(first, 11), (second, 2)])
+        recipe_ingredient = recipes[0].recipeingredients.get(
+            ingredient=second
+        )
+        recipe_ingredient.ingredient = third
+        recipe_ingredient.amount = 4
+        recipe_ingredient.save()
+        self.assert_shopping_list([(first, 11), (third, 4)])
+        recipes[0].recipeingredients.get(ingredient=first).delete()
+        self.assert_shopping_list([(first, 10), (third, 4)])
+        ShoppingCart.objects.filter(recipe=recipes[1]).delete()
+        self.assert_shopping_list([(third, 4)])
+        ShoppingCart.objects.create(user=self.user, recipe=recipes[1])
+        recipes[1].delete()
+        self.assert_shopping_list([(third, 4)])
+        author.delete()
+        self.assert_shopping_list([])
+
+    @override_settings(IMAGE_RENDITION_WORKERS=0)
+    def test_image_renditions(self):
+        """После сохранения рецепта появляются копии картинки и srcset."""
+        with self.captureOnCommitCallbacks(execute=True):
+            _, response = self.create_recipe([(self.ingredients[0], 1)])
+        recipe = Recipe.objects.get(id=response.data["id"])
+        self.assertEqual(recipe.image_renditions["source"], recipe.image.name)
+        path = recipe.image_renditions["thumbnail"]["webp"]
+        self.assertTrue(default_storage.exists(path))
+        response = self.client.get(f"/api/recipes/{recipe.id}/")
+        self.assertRegex(
+            response.data["image_srcset"]["webp"],
+            r"^http://testserver/media/recipes/renditions/.+\.webp 1w$",
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertFalse(default_storage.exists(path))
+
+    def test_generate_image_renditions_command(self):
+        _, response = self.create_recipe([(self.ingredients[0], 1)])
+        recipe = Recipe.objects.get(id=response.data["id"])
+        self.assertEqual(recipe.image_renditions, {})
+        self.assertEqual(
+            self.client.get(f"/api/recipes/{recipe.id}/").data[
+                "image_srcset"
+            ],
+            {},
+        )
+        call_command(
+            "generate_image_renditions", workers=1, stdout=io.StringIO()
+        )
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_renditions["source"], recipe.image.name)
+
+    def test_invalid_images(self):
+        for image in (
+            "data:image/png;base64,"
+            + base64.b64encode(b"not an image").decode(),
+            "data:image/png;base64,!!!!",
+            "data:image/png" + "A" * 100,
+        ):
+            with self.subTest(image=image):
+                response = self.client.post(
+                    "/api/recipes/",
+                    self.recipe_data(
+                        [(self.ingredients[0], 1)], image=image
+                    ),
+                    format="json",
+                )
+                self.assertEqual(
+                    response.status_code, HTTPStatus.BAD_REQUEST
+                )
+                self.assertIn("image", response.data)
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=10)
+    def test_image_max_size(self):
+        response = self.client.post(
+            "/api/recipes/",
+            self.recipe_data([(self.ingredients[0], 1)]),
+            format="json",
+        )
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertEqual(
+            response.data["image"], ["Размер картинки больше 10 байт."]
+        )
+
+    def multipart_data(self, image):
+        return {
+            "name": "Рецепт",
+            "text": "Описание",
+            "cooking_time": 10,
+            "tags": [self.tag.id],
+            "ingredients[0]id": self.ingredients[0].id,
+            "ingredients[0]amount": 2,
+            "image": SimpleUploadedFile("image.png", image, "image/png"),
+        }
+
+    def test_create_multipart(self):
+        """Рецепт можно создать формой с картинкой в виде файла."""
+        response = self.client.post(
+            "/api/recipes/",
+            self.multipart_data(base64.b64decode(IMAGE.split(",")[1])),
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertEqual(response.data["ingredients"][0]["amount"], 2)
+        recipe = Recipe.objects.get(id=response.data["id"])
+        self.assertTrue(default_storage.exists(recipe.image.name))
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=10)
+    def test_create_multipart_max_size(self):
+        response = self.client.post(
+            "/api/recipes/",
+            self.multipart_data(base64.b64decode(IMAGE.split(",")[1])),
+            format="multipart",
+        )
+        self.assertEqual(
+            response.status_code, HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+        )
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_upload_binary_image(self):
+        """Картинку рецепта можно заменить, передав её телом запроса."""
+        _, response = self.create_recipe([(self.ingredients[0], 1)])
+        recipe = Recipe.objects.get(id=response.data["id"])
+        response = self.client.put(
+            f"/api/recipes/{recipe.id}/image/",
+            base64.b64decode(OTHER_IMAGE.split(",")[1]),
+            content_type="image/png",
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.data["name"], "Рецепт")
+        self.assertNotEqual(
+            Recipe.objects.get(id=recipe.id).image.name, recipe.image.name
+        )
+        for content_type, body, expected in (
+            ("image/png", b"not an image", HTTPStatus.BAD_REQUEST),
+            ("text/plain", b"text", HTTPStatus.UNSUPPORTED_MEDIA_TYPE),
+        ):
+            with self.subTest(content_type=content_type):
+                response = self.client.put(
+                    f"/api/recipes/{recipe.id}/image/",
+                    body,
+                    content_type=content_type,
+                )
+                self.assertEqual(response.status_code, expected)
+        with override_settings(RECIPE_IMAGE_MAX_SIZE=10):
+            response = self.client.put(
+                f"/api/recipes/{recipe.id}/image/",
+                base64.b64decode(OTHER_IMAGE.split(",")[1]),
+                content_type="image/png",
+            )
+        self.assertEqual(
+            response.status_code, HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+        )
+        other = User.objects.create_user(
+            email="other@test.ru", username="other", password="password"
+        )
+        self.client.force_authenticate(other)
+        response = self.client.put(
+            f"/api/recipes/{recipe.id}/image/",
+            base64.b64decode(OTHER_IMAGE.split(",")[1]),
+            content_type="image/png",
+        )
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
+
+    @override_settings(IMAGE_RENDITION_WORKERS=0)
+    def test_same_image_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом, пока он нужен."""
+        with self.captureOnCommitCallbacks(execute=True):
+            _, first = self.create_recipe([(self.ingredients[0], 1)])
+            _, second = self.create_recipe([(self.ingredients[1], 1)])
+        first = Recipe.objects.get(id=first.data["id"])
+        second = Recipe.objects.get(id=second.data["id"])
+        path = first.image.name
+        self.assertRegex(path, r"^recipes/[0-9a-f]{2}/[0-9a-f]{64}\.png$")
+        self.assertEqual(second.image.name, path)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                f"/api/recipes/{second.id}/",
+                self.recipe_data(
+                    [(self.ingredients[1], 1)], image=OTHER_IMAGE
+                ),
+                format="json",
+            )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        second.refresh_from_db()
+        self.assertNotEqual(second.image.name, path)
+        self.assertFalse(default_storage.exists(path))
+        self.assertTrue(default_storage.exists(second.image.name))
+
+    def test_delete_unused_images(self):
+        _, response = self.create_recipe([(self.ingredients[0], 1)])
+        recipe = Recipe.objects.get(id=response.data["id"])
+        orphan = default_storage.save(
+            "recipes/orphan.txt", io.BytesIO(b"orphan")
+        )
+        call_command("delete_unused_images", stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(recipe.image.name))
+
+
+class CountersTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="user@test.ru", username="user", password="password"
+        )
+        cls.author = User.objects.create_user(
+            email="author@test.ru", username="author", password="password"
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author,
+                name=f"Рецепт {i}",
+                text="Описание",
+                cooking_time=10,
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются вместе с избранным, корзиной и подписками."""
+        recipe = self.recipes[0]
+        self.client.post(f"/api/recipes/{recipe.id}/favorite/")
+        self.client.post(f"/api/recipes/{recipe.id}/shopping_cart/")
+        self.client.post(f"/api/users/{self.author.id}/subscribe/")
+        response = self.client.get(f"/api/recipes/{recipe.id}/")
+        self.assertEqual(response.data["favorites_count"], 1)
+        self.assertEqual(response.data["carts_count"], 1)
+        response = self.client.get("/api/users/subscriptions/")
+        self.assertEqual(response.data["results"][0]["recipes_count"], 3)
+        self.assertEqual(response.data["results"][0]["followers_count"], 1)
+        # Сохранение прочитанного ранее объекта не затирает счётчики.
+        stale = Recipe.objects.get(id=recipe.id)
+        self.client.delete(f"/api/recipes/{recipe.id}/favorite/")
+        stale.name = "Новое название"
+        stale.save()
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (recipe.name, recipe.favorites_count, recipe.carts_count),
+            ("Новое название", 0, 1),
+        )
+        self.recipes[1].delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 2)
+        self.client.delete(f"/api/users/{self.author.id}/subscribe/")
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+
+    def count_delete_queries(self, marks):
+        users = [
+            User.objects.create(
+                email=f"fan{marks}-{i}@test.ru", username=f"fan{marks}-{i}"
+            )
+            for i in range(marks)
+        ]
+        recipe = Recipe.objects.create(
+            author=self.author, name="Рецепт", text="Описание",
+            cooking_time=10,
+        )
+        for user in users:
+            Favorite.objects.create(user=user, recipe=recipe)
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+        with CaptureQueriesContext(connection) as context:
+            recipe.delete()
+        self.assertFalse(Favorite.objects.filter(recipe=recipe).exists())
+        self.assertFalse(ShoppingCart.objects.filter(recipe=recipe).exists())
+        return len(context.captured_queries)
+
+    def test_recipe_delete_queries_do_not_depend_on_marks(self):
+        """Удаление рецепта не обновляет его счётчики по каждой строке."""
+        self.assertEqual(
+            self.count_delete_queries(1), self.count_delete_queries(20)
+        )
+
+    def test_user_delete_updates_other_counters(self):
+        """Удаление пользователя уменьшает счётчики чужих рецептов."""
+        recipe = self.recipes[0]
+        Favorite.objects.create(user=self.user, recipe=recipe)
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        self.user.delete()
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.favorites_count, recipe.carts_count), (0, 0))
+        call_command(
+            "rebuild_popularity", verify=True, stdout=io.StringIO()
+        )
+
+    def test_ordering_by_counters(self):
+        first, second, third = self.recipes
+        self.client.post(f"/api/recipes/{second.id}/favorite/")
+        self.client.post(f"/api/recipes/{first.id}/shopping_cart/")
+        response = self.client.get("/api/recipes/?ordering=favorites")
+        self.assertEqual(
+            [recipe["id"] for recipe in response.data["results"]],
+            [second.id, third.id, first.id],
+        )
+        response = self.client.get("/api/recipes/?ordering=carts&cursor=")
+        self.assertEqual(
+            [recipe["id"] for recipe in response.data["results"]],
+            [first.id, third.id, second.id],
+        )
+        response = self.client.get("/api/recipes/?ordering=unknown")
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_reconcile_counters(self):
+        Recipe.objects.filter(id=self.recipes[0].id).update(
+            favorites_count=5
+        )
+        User.objects.filter(id=self.author.id).update(recipes_count=0)
+        with self.assertRaises(CommandError):
+            call_command(
+                "reconcile_counters", verify=True, stdout=io.StringIO()
+            )
+        call_command("reconcile_counters", stdout=io.StringIO())
+        call_command("reconcile_counters", verify=True, stdout=io.StringIO())
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 3)
+        self.assertEqual(
+            Recipe.objects.get(id=self.recipes[0].id).favorites_count, 0
+        )
+
+
+class PopularityTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                email=f"user{i}@test.ru",
+                username=f"user{i}",
+                password="password",
+            )
+            for i in range(3)
+        ]
+        cls.tag = Tag.objects.create(
+            name="Завтрак", color="#E26C2D", slug="lunch"
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.users[0],
+                name=f"Рецепт {i}",
+                text="Описание",
+                cooking_time=10,
+            )
+            for i in range(3)
+        ]
+        for recipe in cls.recipes:
+            recipe.tags.add(cls.tag)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def get_ids(self, url):
+        response = self.client.get(url)
+        return [recipe["id"] for recipe in response.data["results"]]
+
+    def test_popular_and_trending(self):
+        """Давние добавления поднимают рецепт в popular, но не в trending."""
+        old, recent, empty = self.recipes
+        for user in self.users[1:]:
+            Favorite.objects.create(user=user, recipe=old)
+        Favorite.objects.filter(recipe=old).update(
+            created_at=timezone.now() - timedelta(days=30)
+        )
+        call_command("rebuild_popularity", stdout=io.StringIO())
+        self.client.force_authenticate(self.users[1])
+        self.client.post(f"/api/recipes/{recent.id}/shopping_cart/")
+        self.assertEqual(
+            self.get_ids("/api/recipes/?ordering=popular"),
+            [old.id, recent.id, empty.id],
+        )
+        self.assertEqual(
+            self.get_ids(
+                f"/api/recipes/?ordering=trending&tags={self.tag.slug}"
+            ),
+            [recent.id, old.id, empty.id],
+        )
+        self.assertEqual(
+            self.get_ids(
+                f"/api/recipes/?ordering=popular&author={self.users[0].id}"
+                "&is_in_shopping_cart=1"
+            ),
+            [recent.id],
+        )
+        # Инкрементальные изменения совпадают с полным пересчётом.
+        self.client.delete(f"/api/recipes/{old.id}/favorite/")
+        call_command(
+            "rebuild_popularity", verify=True, stdout=io.StringIO()
+        )
+        self.client.delete(f"/api/recipes/{recent.id}/shopping_cart/")
+        call_command(
+            "rebuild_popularity", verify=True, stdout=io.StringIO()
+        )
+        self.assertEqual(
+            RecipePopularity.objects.get(recipe=recent).trending, 0
+        )
+
+    def test_ordering_cursor_pagination(self):
+        for recipe, favorites in zip(self.recipes, (1, 2, 1)):
+            for user in self.users[:favorites]:
+                Favorite.objects.create(user=user, recipe=recipe)
+        ids = []
+        url = "/api/recipes/?ordering=trending&limit=1&cursor="
+        while url:
+            response = self.client.get(url)
+            ids += [recipe["id"] for recipe in response.data["results"]]
+            url = response.data["next"]
+        first, second, third = self.recipes
+        self.assertEqual(ids, [second.id, third.id, first.id])
+        call_command(
+            "rebuild_popularity", verify=True, stdout=io.StringIO()
+        )
+
+    def test_rebuild_popularity_verify(self):
+        RecipePopularity.objects.filter(recipe=self.recipes[0]).update(
+            popular=3
+        )
+        with self.assertRaises(CommandError):
+            call_command(
+                "rebuild_popularity", verify=True, stdout=io.StringIO()
+            )
+
+
+@override_settings(METRICS_SAMPLE_RATE=1)
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_server_timing(self):
+        """Замеренный ответ содержит время и число SQL-запросов."""
+        response = self.client.get("/api/tags/")
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^db;dur=[\d.]+;desc="\d+ queries", '
+            r"render;dur=[\d.]+, total;dur=[\d.]+$",
+        )
+
+    def test_async_requests_are_not_serialized(self):
+        """Под ASGI замеренные запросы обрабатываются параллельно."""
+
+        def query():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+
+        async def get_response(request):
+            await asyncio.sleep(0.2)
+            await sync_to_async(query)()
+            return HttpResponse(b"ok")
+
+        middleware = MetricsMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+
+        async def handle(count):
+            return await asyncio.gather(
+                *(
+                    middleware(RequestFactory().get("/api/tags/"))
+                    for _ in range(count)
+                )
+            )
+
+        started = time.monotonic()
+        responses = asyncio.run(handle(4))
+        self.assertLess(time.monotonic() - started, 0.6)
+        for response in responses:
+            self.assertIn('desc="1 queries"', response["Server-Timing"])
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_sampling_disabled(self):
+        response = self.client.get("/api/tags/")
+        self.assertFalse(response.has_header("Server-Timing"))
+
+    def test_metrics_endpoint(self):
+        """Гистограммы собираются по видам и действиям."""
+        self.client.get("/api/recipes/")
+        user = User.objects.create_user(
+            email="user@test.ru",
+            username="user",
+            first_name="Имя",
+            last_name="Фамилия",
+            password="password",
+        )
+        self.client.force_authenticate(user)
+        response = self.client.get("/api/recipes/download_shopping_cart/")
+        b"".join(response.streaming_content)
+        response.close()
+        body = self.client.get("/metrics").content.decode()
+        for view in (
+            "RecipeViewSet.list",
+            "RecipeViewSet.download_shopping_cart",
+        ):
+            self.assertIn(
+                f'foodgram_db_queries_count{{view="{view}"}}', body
+            )
+        self.assertIn("foodgram_response_size_bytes_bucket", body)
+        self.assertIn('foodgram_response_cache_total{result="miss"}', body)
+
+
+class LoadCSVTestCase(TestCase):
+    ROWS = [("соль", "г"), ("молоко", "мл"), ("яйца", "шт.")]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, filename, content):
+        path = os.path.join(self.directory, filename)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        return path
+
+    def write_csv(self, rows):
+        return self.write(
+            "ingredients.csv",
+            "".join(f"{name},{unit}\n" for name, unit in rows),
+        )
+
+    def load(self, path, **options):
+        stdout = io.StringIO()
+        call_command("load_csv", path=path, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def loaded(self):
+        return set(
+            Ingredient.objects.values_list("name", "measurement_unit")
+        )
+
+    def test_load_csv(self):
+        """Строки csv загружаются пачками."""
+        output = self.load(self.write_csv(self.ROWS), batch_size=2)
+        self.assertEqual(self.loaded(), set(self.ROWS))
+        self.assertIn("добавлено: 3, пропущено: 0", output)
+
+    def test_load_json(self):
+        """Массив json читается по частям, объекты не теряются на стыках."""
+        path = self.write(
+            "ingredients.json",
+            json.dumps(
+                [
+                    {"name": name, "measurement_unit": unit}
+                    for name, unit in self.ROWS
+                ],
+                ensure_ascii=False,
+                indent=2,
+            ),
+        )
+        with patch(
+            "recipes.management.commands.load_csv.READ_CHUNK_SIZE", 7
+        ):
+            output = self.load(path)
+        self.assertEqual(self.loaded(), set(self.ROWS))
+        self.assertIn("добавлено: 3, пропущено: 0", output)
+
+    def test_reimport_skips_existing(self):
+        """Повторная загрузка добавляет только новые ингредиенты."""
+        self.load(self.write_csv(self.ROWS[:2]))
+        output = self.load(self.write_csv(self.ROWS))
+        self.assertEqual(self.loaded(), set(self.ROWS))
+        self.assertIn("Строк: 3, добавлено: 1, пропущено: 2", output)
+
+    def test_dry_run(self):
+        """В режиме проверки файл читается, но ничего не записывается."""
+        output = self.load(self.write_csv(self.ROWS), dry_run=True)
+        self.assertFalse(Ingredient.objects.exists())
+        self.assertIn("Строк: 3", output)
+        self.assertIn("без записи", output)
+
+    def test_truncated_json(self):
+        """Оборванный json - ошибка, уже прочитанные строки не пишутся."""
+        content = json.dumps(
+            [
+                {"name": name, "measurement_unit": unit}
+                for name, unit in self.ROWS
+            ],
+            ensure_ascii=False,
+        )
+        path = self.write("ingredients.json", content[:-20])
+        with self.assertRaisesMessage(CommandError, "обрывается"):
+            self.load(path, batch_size=1)
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_json_must_be_array(self):
+        path = self.write("ingredients.json", '{"name": "соль"}')
+        with self.assertRaisesMessage(CommandError, "json-массив"):
+            self.load(path)
+
+
+class BenchmarkCommandTestCase(TestCase):
+    def test_benchmark_report(self):
+        """Все сценарии проходят без ошибок, данные откатываются."""
+        with tempfile.NamedTemporaryFile(suffix=".json") as file:
+            call_command(
+                "benchmark",
+                users=5,
+                recipes=30,
+                requests=3,
+                warmup=0,
+                output=file.name,
+                stderr=io.StringIO(),
+            )
+            report = json.load(file)
+        for name, result in report["scenarios"].items():
+            with self.subTest(scenario=name):
+                self.assertEqual(result["errors"], 0)
+                self.assertEqual(result["requests"], 3)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+
+async def asgi_request(application, method, url, headers=()):
+    """Запрос через ASGI-приложение: (статус, заголовки, тело)."""
+    path, _, query = url.partition("?")
+    communicator = ApplicationCommunicator(
+        application,
+        {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(b"host", b"testserver"), *headers],
+            "client": ("127.0.0.1", 0),
+            "server": ("testserver", 80),
+        },
+    )
+    await communicator.send_input({"type": "http.request"})
+    start = await communicator.receive_output(5)
+    body = b""
+    while True:
+        message = await communicator.receive_output(5)
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    headers = {
+        name.decode().lower(): value.decode()
+        for name, value in start["headers"]
+    }
+    return start["status"], headers, body
+
+
+@override_settings(ROOT_URLCONF="foodgram.urls_async", METRICS_SAMPLE_RATE=1)
+class AsyncViewsTestCase(TransactionTestCase):
+    """Запросы через ASGI-приложение, как под uvicorn."""
+
+    def setUp(self):
+        caches["responses"].clear()
+        bump_version("tags")
+        self.tag = Tag.objects.create(
+            name="Завтрак", color="#E26C2D", slug="lunch"
+        )
+        self.application = get_asgi_application()
+
+    def request(self, url, method="GET", headers=()):
+        return asyncio.run(
+            asgi_request(self.application, method, url, headers)
+        )
+
+    def test_routes(self):
+        """Чтение асинхронное, действия списков не перехватываются."""
+        for url in ("/api/recipes/", "/api/tags/", "/api/ingredients/"):
+            with self.subTest(url=url):
+                self.assertTrue(
+                    asyncio.iscoroutinefunction(
+                        resolve(url, "foodgram.urls_async").func
+                    )
+                )
+        for url in (
+            "/api/recipes/download_shopping_cart/",
+            "/api/recipes/1/shopping_cart/",
+            "/api/users/me/",
+            "/api/users/subscriptions/",
+            "/api/auth/token/login/",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(
+                    resolve(url, "foodgram.urls_async").url_name,
+                    resolve(url, "foodgram.urls").url_name,
+                )
+
+    def test_requests_run_concurrently(self):
+        """Медленные запросы не ждут друг друга и выполняются в пуле БД."""
+        threads = []
+        list_tags = TagViewSet.list
+
+        def slow_list(view, request, *args, **kwargs):
+            threads.append(threading.current_thread().name)
+            time.sleep(0.5)
+            # Запрос в потоке пула попадает в замеры.
+            Tag.objects.count()
+            return list_tags(view, request, *args, **kwargs)
+
+        async def handle(count):
+            return await asyncio.gather(
+                *(
+                    asgi_request(self.application, "GET", "/api/tags/")
+                    for _ in range(count)
+                )
+            )
+
+        started = time.monotonic()
+        with patch.object(TagViewSet, "list", slow_list):
+            responses = asyncio.run(handle(4))
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertTrue(all(name.startswith("db") for name in threads))
+        for status, headers, body in responses:
+            self.assertEqual(status, HTTPStatus.OK)
+            self.assertEqual(json.loads(body)[0]["slug"], self.tag.slug)
+            queries = re.search(
+                r'desc="(\d+) queries"', headers["server-timing"]
+            ).group(1)
+            self.assertGreater(int(queries), 0)
+
+    def test_download_shopping_cart(self):
+        """Выгрузка отдаётся через ASGI, тело не обращается к БД."""
+        user = User.objects.create_user(
+            email="user@test.ru",
+            username="user",
+            first_name="Имя",
+            last_name="Фамилия",
+            password="password",
+        )
+        recipe = Recipe.objects.create(
+            author=user, name="Рецепт", text="Описание", cooking_time=5
+        )
+        RecipeIngredient.objects.create(
+            recipe=recipe,
+            ingredient=Ingredient.objects.create(
+                name="соль", measurement_unit="г"
+            ),
+            amount=3,
+        )
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+        token = Token.objects.create(user=user)
+        status, headers, body = self.request(
+            "/api/recipes/download_shopping_cart/",
+            headers=[(b"authorization", f"Token {token.key}".encode())],
+        )
+        self.assertEqual(status, HTTPStatus.OK)
+        self.assertIn("соль", body.decode())
+        self.assertIn("server-timing", headers)
+
+    def test_write_on_async_route(self):
+        """POST на тот же адрес тоже обслуживается."""
+        status, _, _ = self.request("/api/recipes/", method="POST")
+        self.assertEqual(status, HTTPStatus.UNAUTHORIZED)
+
+
+@skipUnless(connection.vendor == "postgresql", "Планы запросов PostgreSQL")
+class QueryPlanTestCase(TestCase):
+    """Запросы эндпоинтов не читают большие таблицы целиком."""
+
+    USERS_COUNT = 2000
+    RECIPES_COUNT = 50_000
+    TAGS_COUNT = 30
+    FAVORITES_PER_USER = 20
+    FOLLOWS_PER_USER = 10
+    LARGE_TABLES = {
+        "recipes_recipe",
+        "recipes_recipe_tags",
+        "recipes_recipeingredient",
+        "recipes_favorite",
+        "recipes_shoppingcart",
+        "recipes_recipepopularity",
+        "users_follow",
+        "users_user",
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            User(
+                email=f"user{i}@test.ru",
+                username=f"user{i}",
+                first_name="Имя",
+                last_name="Фамилия",
+            )
+            for i in range(cls.USERS_COUNT)
+        )
+        cls.user = users[0]
+        tags = Tag.objects.bulk_create(
+            Tag(name=f"Тег {i}", color=f"#{i:06X}", slug=f"tag{i}")
+            for i in range(cls.TAGS_COUNT)
+        )
+        cls.tag = tags[0]
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"Продукт {i}", measurement_unit="г")
+            for i in range(100)
+        )
+        recipes = Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author=users[i % cls.USERS_COUNT],
+                    name=f"Рецепт {i}",
+                    text="Описание",
+                    cooking_time=10,
+                )
+                for i in range(cls.RECIPES_COUNT)
+            ),
+            batch_size=5000,
+        )
+        cls.recipe = recipes[0]
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(
+                    recipe_id=recipe.id, tag_id=tags[i % len(tags)].id
+                )
+                for i, recipe in enumerate(recipes)
+            ),
+            batch_size=5000,
+        )
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=ingredients[(i + shift) % len(ingredients)],
+                    amount=1,
+                )
+                for i, recipe in enumerate(recipes)
+                for shift in (0, 1)
+            ),
+            batch_size=5000,
+        )
+        for model in (Favorite, ShoppingCart):
+            model.objects.bulk_create(
+                (
+                    model(
+                        user=user,
+                        recipe=recipes[
+                            (i * cls.FAVORITES_PER_USER + j) % len(recipes)
+                        ],
+                    )
+                    for i, user in enumerate(users)
+                    for j in range(cls.FAVORITES_PER_USER)
+                ),
+                batch_size=5000,
+            )
+        Follow.objects.bulk_create(
+            (
+                Follow(user=user, author=users[(i + j) % len(users)])
+                for i, user in enumerate(users)
+                for j in range(1, cls.FOLLOWS_PER_USER + 1)
+            ),
+            batch_size=5000,
+        )
+        # bulk_create не отправляет сигналы, которые ведут рейтинги.
+        RecipePopularity.objects.rebuild()
+        with connection.cursor() as cursor:
+            for table in cls.LARGE_TABLES:
+                cursor.execute(f"ANALYZE {table}")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_seq_scans(self, plan, limited):
+        """Последовательные чтения больших таблиц в узлах плана."""
+        scans = []
+        if (
+            plan["Node Type"] == "Seq Scan"
+            and plan["Relation Name"] in self.LARGE_TABLES
+            and (limited or "Filter" in plan)
+        ):
+            scans.append(plan["Relation Name"])
+        for child in plan.get("Plans", ()):
+            scans += self.get_seq_scans(child, limited)
+        return scans
+
+    def assert_index_scans(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        for query in context.captured_queries:
+            sql = query["sql"]
+            if not sql.startswith("SELECT"):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+                plan = cursor.fetchone()[0][0]["Plan"]
+            # Страница выдачи не должна читать таблицу целиком, а
+            # остальные запросы - отбрасывать строки фильтром.
+            with self.subTest(url=url, sql=sql):
+                self.assertEqual(
+                    self.get_seq_scans(plan, " LIMIT " in sql), []
+                )
+
+    def test_recipe_list_plans(self):
+        self.assert_index_scans("/api/recipes/")
+
+    def test_recipe_author_filter_plans(self):
+        self.assert_index_scans(
+            f"/api/recipes/?author={self.recipe.author_id}"
+        )
+
+    def test_recipe_tags_filter_plans(self):
+        self.assert_index_scans(f"/api/recipes/?tags={self.tag.slug}")
+
+    def test_recipe_favorites_plans(self):
+        self.assert_index_scans("/api/recipes/?is_favorited=1")
+
+    def test_recipe_shopping_cart_plans(self):
+        self.assert_index_scans("/api/recipes/?is_in_shopping_cart=1")
+
+    def test_recipe_ordering_plans(self):
+        for ordering in RECIPE_ORDERINGS:
+            self.assert_index_scans(f"/api/recipes/?ordering={ordering}")
+
+    def test_recipe_detail_plans(self):
+        self.assert_index_scans(f"/api/recipes/{self.recipe.id}/")
+
+    def test_subscriptions_plans(self):
+        self.assert_index_scans("/api/users/subscriptions/?recipes_limit=3")
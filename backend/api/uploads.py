@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import FileUploadParser
+
+
+class ImageTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_code = "max_size"
+
+    def __init__(self, max_size):
+        super().__init__(
+            {"image": [f"Размер картинки больше {max_size} байт."]}
+        )
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """Загрузка файлов частями во временный файл с пределом размера.
+
+    В памяти одновременно держится только одна часть файла, а
+    превышение предела обнаруживается до того, как тело прочитано.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_size = settings.RECIPE_IMAGE_MAX_SIZE
+
+    def handle_raw_input(
+        self, input_data, META, content_length, boundary, encoding=None
+    ):
+        # Для сырого тела картинки размер известен заранее.
+        if boundary is None and content_length > self.max_size:
+            raise ImageTooLarge(self.max_size)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            self.file.close()
+            raise ImageTooLarge(self.max_size)
+        return super().receive_data_chunk(raw_data, start)
+
+
+class ImageUploadParser(FileUploadParser):
+    """Тело запроса - картинка целиком, например Content-Type: image/png."""
+
+    media_type = "image/*"
+
+    def get_filename(self, stream, media_type, parser_context):
+        filename = super().get_filename(stream, media_type, parser_context)
+        if filename:
+            return filename
+        return "image." + media_type.split(";")[0].split("/")[-1].strip()
@@ -1,11 +1,25 @@
+import time
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.shortcuts import HttpResponse, get_object_or_404
+from django.db.models import (
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    Value,
+)
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
@@ -13,13 +27,25 @@ from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
-    RecipeIngredient,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
 )
 from users.models import Follow
+from api.cache import (
+    AnonymousResponseCacheMixin,
+    ConditionalGetMixin,
+    get_aggregate_state,
+    get_user_state,
+    make_etag,
+)
+from api.exporters import SHOPPING_CART_EXPORTERS
 from api.filters import RecipeFilter, IngredientsFilter
+from api.metrics import render_metrics
 from api.permissions import AuthorOrReadOnly
+from api.renderers import CSVRenderer, PlainTextRenderer
+from api.search import ingredient_index
+from api.snapshots import ingredients_snapshot, tags_snapshot
 from api.serializers import (
     FavoriteSerializer,
     FollowGetSerializer,
@@ -31,7 +57,9 @@ from api.serializers import (
     ShoppingCartSerializer,
     TagSerializer,
     UserGetSerializer,
+    get_recipes_limit,
 )
+from api.uploads import ImageUploadParser, LimitedUploadHandler
 
 User = get_user_model()
 
@@ -70,7 +98,23 @@ class CustomUserViewSet(UserViewSet):
     )
     def subscriptions(self, request):
         """Отображение подписок пользователя."""
-        queryset = User.objects.filter(following__user=request.user)
+        recipes = Recipe.objects.all()
+        recipes_limit = get_recipes_limit(request)
+        if recipes_limit is not None:
+            recipes = recipes.filter(
+                id__in=Subquery(
+                    Recipe.objects.filter(
+                        author=OuterRef("author")
+                    ).values("id")[:recipes_limit]
+                )
+            )
+        queryset = (
+            User.objects.filter(following__user=request.user)
+            .order_by("id")
+            .prefetch_related(
+                Prefetch("recipes", recipes, to_attr="recipes_preview")
+            )
+        )
         pages = self.paginate_queryset(queryset)
         serializer = FollowGetSerializer(
             pages, many=True, context={"request": request}
@@ -78,7 +122,7 @@ class CustomUserViewSet(UserViewSet):
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(ModelViewSet):
+class TagViewSet(ConditionalGetMixin, ModelViewSet):
     """Вьюсет для  работы с тегами."""
 
     permission_classes = [AuthorOrReadOnly]
@@ -86,8 +130,26 @@ class TagViewSet(ModelViewSet):
     serializer_class = TagSerializer
     pagination_class = None
 
+    def get_validators(self):
+        if self.action == "list":
+            return tags_snapshot.get_etag(self.request), None
+        if not str(self.kwargs["pk"]).isdigit():
+            return None, None
+        last_modified, count = get_aggregate_state(
+            Tag.objects.filter(pk=self.kwargs["pk"])
+        )
+        if not count:
+            return None, None
+        return make_etag(last_modified, count), last_modified
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+    def list(self, request, *args, **kwargs):
+        """Список тегов отдаётся готовым json из памяти."""
+        return self.conditional_response(
+            lambda: tags_snapshot.get_response(request)
+        )
+
+
+class IngredientViewSet(ConditionalGetMixin, ReadOnlyModelViewSet):
     permission_classes = [AuthorOrReadOnly]
     """Вьюсет для работы с ингредиентами."""
     queryset = Ingredient.objects.all()
@@ -96,18 +158,129 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientsFilter
 
+    def get_validators(self):
+        """У списков только ETag: по содержимому индекса или json."""
+        if self.action == "list" and self.request.query_params.get("name"):
+            return make_etag(ingredient_index.digest), None
+        if self.action == "list":
+            return ingredients_snapshot.get_etag(self.request), None
+        if not str(self.kwargs["pk"]).isdigit():
+            return None, None
+        last_modified, count = get_aggregate_state(
+            Ingredient.objects.filter(pk=self.kwargs["pk"])
+        )
+        if not count:
+            return None, None
+        return make_etag(last_modified, count), last_modified
+
+    def filter_queryset(self, queryset):
+        # Ингредиент по id отдаётся независимо от параметров поиска.
+        if self.action == "retrieve":
+            return queryset
+        return super().filter_queryset(queryset)
+
+    def list(self, request, *args, **kwargs):
+        """Список и автодополнение отдаются готовым json из памяти.
+
+        Пока другой поток перестраивает индекс, поиск выполняется
+        в БД через IngredientsFilter, а не ждёт перестройки.
+        """
+        name = request.query_params.get("name")
+        if not name:
+            return self.conditional_response(
+                lambda: ingredients_snapshot.get_response(request)
+            )
+        if not ingredient_index.refresh(wait=False):
+            return super(ConditionalGetMixin, self).list(
+                request, *args, **kwargs
+            )
+        return self.conditional_response(
+            lambda: HttpResponse(
+                ingredient_index.render(name),
+                content_type="application/json",
+            )
+        )
+
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(
+    ConditionalGetMixin, AnonymousResponseCacheMixin, ModelViewSet
+):
     """Вьюсет для работы с рецептами."""
 
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
     permission_classes = [AuthorOrReadOnly]
+    parser_classes = [JSONParser, MultiPartParser]
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Файлы не попадают в память целиком, а их размер ограничен.
+        request.upload_handlers = [LimitedUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_validators(self):
+        """Валидаторы рецепта по дате изменения, списка - по версиям.
+
+        ETag списка строится из версий данных, которые сбрасываются
+        сигналами, поэтому ни 304, ни ответ из кэша не требуют
+        агрегата по таблице рецептов. Last-Modified у списка нет:
+        удаление рецепта не сдвинуло бы его вперёд. Для авторизованных
+        пользователей в ETag входит состояние их избранного, корзины
+        и подписок, а Last-Modified не отдаётся.
+        """
+        user = self.request.user
+        user_state = (
+            (user.id, get_user_state(user)) if user.is_authenticated else ()
+        )
+        if self.action == "list":
+            return make_etag(
+                sorted(self.request.query_params.lists()),
+                self.get_cache_state(),
+                *user_state,
+            ), None
+        if not str(self.kwargs["pk"]).isdigit():
+            return None, None
+        last_modified, count = get_aggregate_state(
+            Recipe.objects.filter(pk=self.kwargs["pk"])
+        )
+        if not count:
+            return None, None
+        if user_state:
+            return make_etag(last_modified, count, *user_state), None
+        return make_etag(last_modified, count), last_modified
+
+    def get_cache_versions(self):
+        if self.action == "retrieve":
+            return (f"recipe:{self.kwargs['pk']}", "tags", "ingredients")
+        return ("recipes", "tags", "ingredients")
+
+    def get_cache_state(self):
+        state = super().get_cache_state()
+        if self.action == "list" and settings.RECIPE_LIST_COUNTERS_MAX_AGE > 0:
+            # Избранное и корзины не сбрасывают версию всех списков:
+            # счётчики и ленты по ним обновляются по интервалам времени.
+            state.append(
+                int(time.time() // settings.RECIPE_LIST_COUNTERS_MAX_AGE)
+            )
+        return state
 
     def get_queryset(self):
-        return Recipe.objects.prefetch_related(
+        queryset = Recipe.objects.select_related("author").prefetch_related(
             "recipeingredients__ingredient", "tags"
-        ).all()
+        )
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+            )
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+        )
 
     def get_serializer_class(self):
         if self.action in ("list", "retrieve"):
@@ -117,6 +290,18 @@ class RecipeViewSet(ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(detail=True, methods=["PUT"], parser_classes=[ImageUploadParser])
+    def image(self, request, pk):
+        """Замена картинки рецепта, переданной телом запроса."""
+        serializer = self.get_serializer(
+            self.get_object(),
+            data={"image": request.data["file"]},
+            partial=True,
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data)
+
     def post_model(self, pk, serializer):
         """Добавление экземпляров модели Favorite/Shopping_cart."""
         recipe = get_object_or_404(Recipe, id=pk)
@@ -168,30 +353,50 @@ class RecipeViewSet(ModelViewSet):
     @shopping_cart.mapping.delete
     def delete_shopping_cart(self, request, pk):
         """Метод для удаления из корзины."""
-        return self.delete_model(ShoppingCart, pk)
-
-    def create_shopping_cart(self, ingredients):
-        shopping_cart = ["Список необходимых ингредиентов:"]
-        for ingredient in ingredients:
-            name = ingredient["ingredient__name"]
-            measurement_unit = ingredient["ingredient__measurement_unit"]
-            amount = ingredient["ingredient_sum"]
-            shopping_cart.append(f"\n{name} - {amount} {measurement_unit}")
-        response = HttpResponse(shopping_cart, content_type="text/plain")
-        response["Content-Disposition"] = "attachment;"
+        with transaction.atomic():
+            return self.delete_model(ShoppingCart, pk)
+
+    def create_shopping_cart(self, ingredients, format):
+        """Потоковая выгрузка списка покупок в выбранном формате.
+
+        Строки читаются до ответа: под ASGI тело отдаётся из event
+        loop, где запросы к БД запрещены. В списке покупок одна строка
+        на ингредиент, поэтому он невелик.
+        """
+        exporter = SHOPPING_CART_EXPORTERS[format]
+        response = StreamingHttpResponse(
+            exporter(list(ingredients)),
+            content_type=self.request.accepted_renderer.media_type,
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="shopping_cart.{format}"'
+        )
         return response
 
     @action(
         detail=False,
         methods=["GET"],
         permission_classes=[IsAuthenticated],
+        renderer_classes=[PlainTextRenderer, CSVRenderer, JSONRenderer],
     )
     def download_shopping_cart(self, request):
-        """Отправка пользователю txt файла с необходимыми ингредиентами."""
+        """Отправка пользователю файла с необходимыми ингредиентами."""
         ingredients = (
-            RecipeIngredient.objects.filter(recipe__cart__user=request.user)
-            .values("ingredient__name", "ingredient__measurement_unit")
+            ShoppingListItem.objects.filter(user=request.user)
+            .values(
+                "ingredient__name",
+                "ingredient__measurement_unit",
+                ingredient_sum=F("amount"),
+            )
             .order_by("ingredient__name")
-            .annotate(ingredient_sum=Sum("amount"))
         )
-        return self.create_shopping_cart(ingredients)
+        return self.create_shopping_cart(
+            ingredients, request.accepted_renderer.format
+        )
+
+
+def metrics(request):
+    """Метрики процесса для Prometheus; снаружи закрыты nginx."""
+    return HttpResponse(
+        render_metrics(), content_type="text/plain; version=0.0.4"
+    )
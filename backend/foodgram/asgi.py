@@ -13,5 +13,6 @@ from django.core.asgi import get_asgi_application
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "foodgram.settings")
+os.environ.setdefault("ROOT_URLCONF", "foodgram.urls_async")
 
 application = get_asgi_application()
@@ -32,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -41,7 +42,8 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
-ROOT_URLCONF = "foodgram.urls"
+# foodgram/asgi.py подключает foodgram.urls_async с асинхронным чтением.
+ROOT_URLCONF = os.getenv("ROOT_URLCONF", "foodgram.urls")
 
 TEMPLATES = [
     {
@@ -69,9 +71,37 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
         "HOST": os.getenv("DB_HOST", ""),
         "PORT": os.getenv("DB_PORT", 5432),
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 0)),
     }
 }
 
+# Потоки для запросов к БД из асинхронных видов; при DB_CONN_MAX_AGE > 0
+# их соединения переиспользуются и работают как пул.
+ASYNC_DB_THREADS = int(os.getenv("ASYNC_DB_THREADS", 20))
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    },
+    "responses": {
+        "BACKEND": os.getenv(
+            "RESPONSE_CACHE_BACKEND",
+            "django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.getenv("RESPONSE_CACHE_LOCATION", "responses"),
+        "TIMEOUT": int(os.getenv("RESPONSE_CACHE_TIMEOUT", 10 * 60)),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000)),
+        },
+    },
+}
+
+# Каталог для готовых json-файлов тегов и ингредиентов, отдаваемых nginx.
+REFERENCE_DATA_DIR = os.getenv("REFERENCE_DATA_DIR", "")
+
 AUTH_USER_MODEL = "users.User"
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -100,6 +130,38 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": 6,
 }
 
+# Кэширование count в постраничных ответах, секунд (0 - не кэшировать).
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.getenv("PAGINATION_COUNT_CACHE_TIMEOUT", 0)
+)
+# Число строк, начиная с которого count выборки без фильтров
+# оценивается по статистике PostgreSQL (0 - всегда считать точно).
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = int(
+    os.getenv("PAGINATION_COUNT_ESTIMATE_THRESHOLD", 0)
+)
+# Предел размера картинки рецепта после декодирования base64, байт.
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv("RECIPE_IMAGE_MAX_SIZE", 10 * 1024 * 1024)
+)
+# Потоки для уменьшенных копий картинок (0 - создавать сразу, в запросе).
+IMAGE_RENDITION_WORKERS = int(os.getenv("IMAGE_RENDITION_WORKERS", 2))
+# Файлы моложе этого срока, секунд, не удаляются как неиспользуемые:
+# на них могут ссылаться рецепты из незафиксированных транзакций.
+MEDIA_GC_GRACE_PERIOD = int(os.getenv("MEDIA_GC_GRACE_PERIOD", 600))
+
+# Период полураспада веса добавлений в избранное и корзины для
+# ?ordering=trending, часов. После изменения - rebuild_popularity.
+TRENDING_HALF_LIFE = float(os.getenv("TRENDING_HALF_LIFE", 72))
+
+# Насколько счётчики избранного и корзин и порядок лент по ним могут
+# отставать в списках рецептов, секунд; карточка рецепта всегда точна.
+RECIPE_LIST_COUNTERS_MAX_AGE = int(
+    os.getenv("RECIPE_LIST_COUNTERS_MAX_AGE", 60)
+)
+
+# Доля запросов с замерами SQL и Server-Timing (0 - выключено).
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", 0))
+
 DJOSER = {"LOGIN_FIELD": "email"}
 
 LANGUAGE_CODE = "en-us"
@@ -117,5 +179,6 @@ STATIC_ROOT = BASE_DIR / "collected_static"
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = "/app/media/"
+DEFAULT_FILE_STORAGE = "recipes.storage.ContentAddressedStorage"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
@@ -0,0 +1,11 @@
+from django.urls import include, path
+
+from foodgram.urls import urlpatterns as sync_urlpatterns
+
+
+# Маршруты роутера API с асинхронными видами проверяются первыми,
+# остальные - как в WSGI.
+urlpatterns = [
+    path("api/", include("api.async_urls")),
+    *sync_urlpatterns,
+]
@@ -0,0 +1,56 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+
+RECONCILE_BATCH_SIZE = 500
+
+# Счётчики: модель, поле счётчика, модель строк, поле связи строки.
+COUNTERS = (
+    (Recipe, "favorites_count", Favorite, "recipe"),
+    (Recipe, "carts_count", ShoppingCart, "recipe"),
+    (User, "followers_count", Follow, "author"),
+    (User, "recipes_count", Recipe, "author"),
+)
+
+
+def change_counter(model, field, id, delta, **fields):
+    """Атомарное изменение счётчика без чтения строки."""
+    value = F(field) + delta
+    if delta < 0:
+        value = Greatest(value, 0)
+    model.objects.filter(id=id).update(**{field: value}, **fields)
+
+
+def get_actual_count(rows, related):
+    return Coalesce(
+        Subquery(
+            rows.objects.filter(**{related: OuterRef("pk")})
+            .order_by()
+            .values(related)
+            .annotate(count=Count("id"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def reconcile(model, field, rows, related, dry_run=False, **fields):
+    """Пересчёт счётчика там, где он разошёлся с числом строк.
+
+    Возвращает id исправленных (при dry_run - найденных) объектов.
+    """
+    actual = get_actual_count(rows, related)
+    ids = list(
+        model.objects.annotate(actual=actual)
+        .exclude(**{field: F("actual")})
+        .values_list("id", flat=True)
+    )
+    if ids and not dry_run:
+        for start in range(0, len(ids), RECONCILE_BATCH_SIZE):
+            model.objects.filter(
+                id__in=ids[start:start + RECONCILE_BATCH_SIZE]
+            ).update(**{field: actual}, **fields)
+    return ids
@@ -0,0 +1,203 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from recipes.models import Recipe
+from recipes.versions import bump_version
+
+
+logger = logging.getLogger(__name__)
+
+# Ширины уменьшенных копий: карточка в ленте, рецепт и полный размер.
+RENDITION_SIZES = (
+    ("thumbnail", 320),
+    ("card", 640),
+    ("full", 1280),
+)
+RENDITION_QUALITY = {"avif": 50, "webp": 75}
+RENDITION_DIR = "recipes/renditions"
+
+# AVIF есть не во всех сборках Pillow.
+RENDITION_FORMATS = tuple(
+    format for format in ("avif", "webp") if features.check(format)
+)
+
+rendition_executor = ThreadPoolExecutor(
+    max_workers=max(1, settings.IMAGE_RENDITION_WORKERS),
+    thread_name_prefix="renditions",
+)
+
+
+def prepare(image):
+    """Поворот по EXIF и режим, поддерживаемый WebP и AVIF."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGB", "RGBA"):
+        return image
+    if "A" in image.mode or "transparency" in image.info:
+        return image.convert("RGBA")
+    return image.convert("RGB")
+
+
+def save_rendition(image, path, format):
+    buffer = BytesIO()
+    image.save(
+        buffer, format=format.upper(), quality=RENDITION_QUALITY[format]
+    )
+    return default_storage.save(path, ContentFile(buffer.getvalue()))
+
+
+def create_renditions(source):
+    """Уменьшенные копии картинки source во всех форматах."""
+    renditions = {"source": source}
+    stem = os.path.splitext(os.path.basename(source))[0]
+    with default_storage.open(source, "rb") as file, Image.open(file) as image:
+        image = prepare(image)
+        widths = set()
+        for name, width in RENDITION_SIZES:
+            width = min(width, image.width)
+            if width in widths:
+                continue
+            widths.add(width)
+            resized = image
+            if width < image.width:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.LANCZOS)
+            renditions[name] = {"width": width}
+            for format in RENDITION_FORMATS:
+                renditions[name][format] = save_rendition(
+                    resized, f"{RENDITION_DIR}/{stem}-{name}.{format}", format
+                )
+    return renditions
+
+
+def get_rendition_paths(renditions):
+    return {
+        path
+        for name, _ in RENDITION_SIZES
+        for format, path in renditions.get(name, {}).items()
+        if format != "width"
+    }
+
+
+def get_recipe_files(image, renditions):
+    return {image, *get_rendition_paths(renditions)} - {""}
+
+
+def get_referenced_files(paths):
+    """Файлы из paths, на которые ссылается хотя бы один рецепт.
+
+    Хранилище не записывает одинаковые файлы дважды, поэтому одна
+    картинка и её копии могут принадлежать нескольким рецептам.
+    """
+    query = Q(image__in=paths)
+    for name, _ in RENDITION_SIZES:
+        for format in RENDITION_QUALITY:
+            query |= Q(**{f"image_renditions__{name}__{format}__in": paths})
+    referenced = set()
+    for files in Recipe.objects.filter(query).values_list(
+        "image", "image_renditions"
+    ):
+        referenced |= get_recipe_files(*files)
+    return referenced & set(paths)
+
+
+def is_recent(path):
+    """Файл недавно записан или переиспользован.
+
+    Такой файл может принадлежать рецепту из ещё не зафиксированной
+    транзакции, поэтому удалять его рано.
+    """
+    grace_period = timedelta(seconds=settings.MEDIA_GC_GRACE_PERIOD)
+    try:
+        modified = default_storage.get_modified_time(path)
+    except OSError:
+        return True
+    return modified > timezone.now() - grace_period
+
+
+def delete_unreferenced(paths):
+    """Удаление файлов, на которые больше не ссылаются рецепты."""
+    paths = set(paths) - {""}
+    if not paths:
+        return
+    for path in paths - get_referenced_files(paths):
+        if not is_recent(path):
+            default_storage.delete(path)
+
+
+def generate_renditions(recipe_id):
+    """Пересоздание копий картинки рецепта, если она изменилась."""
+    recipe = (
+        Recipe.objects.filter(id=recipe_id)
+        .only("image", "image_renditions")
+        .first()
+    )
+    if recipe is None or not recipe.image:
+        return False
+    source = recipe.image.name
+    renditions = create_renditions(source)
+    # Картинку могли заменить, пока создавались копии.
+    updated = Recipe.objects.filter(id=recipe_id, image=source).update(
+        image_renditions=renditions, updated_at=timezone.now()
+    )
+    if not updated:
+        delete_unreferenced(get_rendition_paths(renditions))
+        return False
+    delete_unreferenced(
+        get_rendition_paths(recipe.image_renditions)
+        - get_rendition_paths(renditions)
+    )
+    for name in ("recipes", f"recipe:{recipe_id}"):
+        bump_version(name)
+    return True
+
+
+def run_generate_renditions(recipe_id):
+    close_old_connections()
+    try:
+        generate_renditions(recipe_id)
+    except Exception:
+        logger.exception("Не удалось создать копии картинки %s", recipe_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_renditions(recipe_id):
+    """Копии создаются в фоне; при 0 воркеров - сразу, в этом потоке."""
+    if settings.IMAGE_RENDITION_WORKERS:
+        rendition_executor.submit(run_generate_renditions, recipe_id)
+    else:
+        generate_renditions(recipe_id)
+
+
+def needs_renditions(recipe):
+    return bool(recipe.image) and (
+        recipe.image_renditions.get("source") != recipe.image.name
+    )
+
+
+def get_srcset(recipe, build_url):
+    """srcset по форматам для готовых копий текущей картинки."""
+    renditions = recipe.image_renditions
+    if not recipe.image or renditions.get("source") != recipe.image.name:
+        return {}
+    srcset = {}
+    for format in RENDITION_FORMATS:
+        srcset[format] = ", ".join(
+            f"{build_url(rendition[format])} {rendition['width']}w"
+            for rendition in (
+                renditions.get(name) for name, _ in RENDITION_SIZES
+            )
+            if rendition and format in rendition
+        )
+    return {format: value for format, value in srcset.items() if value}
@@ -0,0 +1,86 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api.filters import IngredientsFilter
+from recipes.models import Ingredient
+
+
+SYLLABLES = (
+    "ба", "ва", "го", "да", "ж", "зе", "ка", "ли", "мо", "ну", "па",
+    "ри", "со", "ту", "фа", "хе", "цы", "чу", "ша", "ще", "эл", "юн",
+    "ян", "ор", "ис", "ук", "ар", "ен", "ол", "ым",
+)
+UNITS = ("г", "кг", "мл", "л", "шт.", "ст. л.", "ч. л.", "по вкусу")
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Замер времени поиска ингредиентов по префиксу на синтетическом "
+        "каталоге. Данные создаются в транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--catalog", type=int, default=100_000)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def generate(self, size, rng):
+        names = set(Ingredient.objects.values_list("name", flat=True))
+        batch = []
+        while len(names) < size:
+            name = "".join(rng.choices(SYLLABLES, k=rng.randint(2, 5)))
+            if rng.random() < 0.3:
+                name += " " + "".join(rng.choices(SYLLABLES, k=2))
+            if name in names:
+                continue
+            names.add(name)
+            batch.append(
+                Ingredient(name=name, measurement_unit=rng.choice(UNITS))
+            )
+        Ingredient.objects.bulk_create(
+            batch, batch_size=5000, ignore_conflicts=True
+        )
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE recipes_ingredient")
+        return sorted(names)
+
+    def measure(self, prefix):
+        started = time.perf_counter()
+        list(
+            IngredientsFilter(
+                {"name": prefix}, queryset=Ingredient.objects.all()
+            ).qs.values_list("id", "name", "measurement_unit")
+        )
+        return (time.perf_counter() - started) * 1000
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        with transaction.atomic():
+            names = self.generate(options["catalog"], rng)
+            self.stdout.write(f"Ингредиентов в каталоге: {len(names)}")
+            for length in (1, 2, 3):
+                prefixes = [
+                    rng.choice(names)[:length]
+                    for _ in range(options["queries"])
+                ]
+                for prefix in prefixes[:5]:
+                    self.measure(prefix)
+                timings = [self.measure(prefix) for prefix in prefixes]
+                self.stdout.write(
+                    f"Префикс из {length} симв.: "
+                    f"p50={statistics.median(timings):.2f} мс, "
+                    f"p95={percentile(timings, 95):.2f} мс, "
+                    f"p99={percentile(timings, 99):.2f} мс"
+                )
+            transaction.set_rollback(True)
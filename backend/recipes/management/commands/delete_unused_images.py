@@ -0,0 +1,49 @@
+import os
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from recipes.images import get_recipe_files, is_recent
+from recipes.models import Recipe
+
+
+def walk(directory):
+    if not default_storage.exists(directory):
+        return
+    directories, files = default_storage.listdir(directory)
+    for name in files:
+        yield os.path.join(directory, name)
+    for name in directories:
+        yield from walk(os.path.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаление картинок рецептов и их копий, на которые не ссылается "
+        "ни один рецепт."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать файлы, ничего не удаляя.",
+        )
+
+    def handle(self, *args, **options):
+        referenced = set()
+        for files in Recipe.objects.values_list(
+            "image", "image_renditions"
+        ).iterator():
+            referenced |= get_recipe_files(*files)
+        deleted = 0
+        directory = Recipe._meta.get_field("image").upload_to
+        for path in walk(directory.rstrip("/")):
+            if path in referenced or is_recent(path):
+                continue
+            if options["dry_run"]:
+                self.stdout.write(path)
+            else:
+                default_storage.delete(path)
+            deleted += 1
+        self.stdout.write(f"Неиспользуемых файлов: {deleted}")
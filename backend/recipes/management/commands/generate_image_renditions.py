@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from recipes.images import generate_renditions, needs_renditions
+from recipes.models import Recipe
+
+
+def generate(recipe_id):
+    try:
+        return recipe_id, generate_renditions(recipe_id), None
+    except Exception as error:
+        return recipe_id, False, error
+
+
+def generate_in_thread(recipe_id):
+    close_old_connections()
+    try:
+        return generate(recipe_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Создание уменьшенных копий картинок для существующих рецептов."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Пересоздать копии и для рецептов, у которых они есть.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=2,
+            help="Потоки для обработки; 1 - без отдельных потоков.",
+        )
+
+    def handle(self, *args, **options):
+        recipe_ids = [
+            recipe.id
+            for recipe in Recipe.objects.exclude(image="")
+            .only("image", "image_renditions")
+            .iterator()
+            if options["force"] or needs_renditions(recipe)
+        ]
+        self.stdout.write(f"Рецептов для обработки: {len(recipe_ids)}")
+        done = failed = 0
+        if options["workers"] > 1:
+            executor = ThreadPoolExecutor(max_workers=options["workers"])
+            results = executor.map(generate_in_thread, recipe_ids)
+        else:
+            executor = None
+            results = map(generate, recipe_ids)
+        for recipe_id, created, error in results:
+            if error is not None:
+                failed += 1
+                self.stderr.write(f"Рецепт {recipe_id}: {error}")
+            else:
+                done += created
+        if executor is not None:
+            executor.shutdown()
+        self.stdout.write(f"Создано: {done}, ошибок: {failed}")
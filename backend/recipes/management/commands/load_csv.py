@@ -1,21 +1,126 @@
 import csv
+import json
 import os
+import time
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
 from recipes.models import Ingredient
+from recipes.signals import reference_data_changed
+from recipes.versions import bump_version
+
+
+DEFAULT_PATH = os.path.join(
+    settings.BASE_DIR, "recipes", "data", "ingredients.csv"
+)
+DEFAULT_BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = row
+            yield name, measurement_unit
+
+
+def read_json(file):
+    """Потоковое чтение массива объектов без загрузки файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != "[":
+                    raise CommandError("Ожидается json-массив ингредиентов.")
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == "]":
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise CommandError("Файл json обрывается.")
+                break
+            yield item["name"], item["measurement_unit"]
+        buffer = buffer[position:]
+        if not chunk:
+            return
+
+
+READERS = {
+    ".csv": read_csv,
+    ".json": read_json,
+}
 
 
 class Command(BaseCommand):
     help = "Загрузка ингредиентов в базу."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default=DEFAULT_PATH,
+            help="Путь к файлу csv или json с ингредиентами.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help="Количество строк в одном INSERT.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Прочитать файл, ничего не записывая в базу.",
+        )
+
     def handle(self, *args, **options):
-        path = os.path.join(settings.BASE_DIR, "ingredients.csv")
-        with open(path, "r", encoding="utf-8") as file:
-            reader_data = csv.reader(file)
-            for name, measurement_unit in reader_data:
-                Ingredient.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit
-                )
+        path = options["path"]
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size должен быть больше нуля.")
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError("Поддерживаются только файлы csv и json.")
+        started = time.monotonic()
+        with open(path, "r", encoding="utf-8") as file, transaction.atomic():
+            count_before = Ingredient.objects.count()
+            rows = reader(file)
+            total = 0
+            while True:
+                batch = [
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in islice(rows, batch_size)
+                ]
+                if not batch:
+                    break
+                total += len(batch)
+                if not options["dry_run"]:
+                    Ingredient.objects.bulk_create(
+                        batch, ignore_conflicts=True
+                    )
+            inserted = Ingredient.objects.count() - count_before
+        if inserted:
+            bump_version("ingredients")
+            reference_data_changed.send(sender=Ingredient)
+        elapsed = time.monotonic() - started
+        speed = f"{total / elapsed if elapsed else total:.0f} строк/с"
+        if options["dry_run"]:
+            self.stdout.write(f"Строк: {total}, {speed} (без записи)")
+            return
+        self.stdout.write(
+            f"Строк: {total}, добавлено: {inserted}, "
+            f"пропущено: {total - inserted}, {speed}"
+        )
@@ -0,0 +1,62 @@
+import math
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import RecipePopularity
+from recipes.signals import bump_version_on_commit
+
+
+# Допустимое расхождение trending из-за округлений при вычитании весов.
+TRENDING_TOLERANCE = 1e-6
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчёт рейтингов popular и trending по избранному и корзинам; "
+        "нужен и после изменения TRENDING_HALF_LIFE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Только сравнить рейтинги с данными, ничего не меняя.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["verify"]:
+            with transaction.atomic():
+                RecipePopularity.objects.rebuild()
+                bump_version_on_commit("recipes")
+            self.stdout.write(self.style.SUCCESS("Рейтинги пересчитаны."))
+            return
+        expected = RecipePopularity.objects.calculate()
+        current = {
+            recipe_id: (popular, trending)
+            for recipe_id, popular, trending in (
+                RecipePopularity.objects.values_list(
+                    "recipe_id", "popular", "trending"
+                )
+            )
+        }
+        mismatched = sorted(
+            recipe_id
+            for recipe_id in expected.keys() | current.keys()
+            if recipe_id not in expected
+            or recipe_id not in current
+            or expected[recipe_id][0] != current[recipe_id][0]
+            or not math.isclose(
+                expected[recipe_id][1],
+                current[recipe_id][1],
+                abs_tol=TRENDING_TOLERANCE,
+            )
+        )
+        for recipe_id in mismatched:
+            self.stdout.write(
+                f"Рецепт {recipe_id}: {current.get(recipe_id)} вместо "
+                f"{expected.get(recipe_id)}"
+            )
+        if mismatched:
+            raise CommandError(f"Расхождений в рейтингах: {len(mismatched)}")
+        self.stdout.write(self.style.SUCCESS("Рейтинги актуальны."))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = "Пересчёт списков покупок по корзинам пользователей."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Только сравнить списки с корзинами, ничего не меняя.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["verify"]:
+            ShoppingListItem.objects.rebuild()
+            self.stdout.write(
+                self.style.SUCCESS("Списки покупок пересчитаны.")
+            )
+            return
+        expected = ShoppingListItem.objects.calculate()
+        current = ShoppingListItem.objects.current()
+        mismatched = {
+            key
+            for key in expected.keys() | current.keys()
+            if expected.get(key) != current.get(key)
+        }
+        for user_id, ingredient_id in sorted(mismatched):
+            self.stdout.write(
+                f"Пользователь {user_id}, ингредиент {ingredient_id}: "
+                f"{current.get((user_id, ingredient_id), 0)} вместо "
+                f"{expected.get((user_id, ingredient_id), 0)}"
+            )
+        if mismatched:
+            raise CommandError(
+                f"Расхождений в списках покупок: {len(mismatched)}"
+            )
+        self.stdout.write(self.style.SUCCESS("Списки покупок актуальны."))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.counters import COUNTERS, reconcile
+from recipes.models import Recipe
+from recipes.signals import bump_version_on_commit, recipe_versions
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверка счётчиков избранного, корзин, подписчиков и рецептов "
+        "с таблицами и исправление расхождений."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Только найти расхождения, ничего не меняя.",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        total = 0
+        for model, field, rows, related in COUNTERS:
+            fields = {}
+            if model is Recipe:
+                # Счётчики рецептов видны в API.
+                fields["updated_at"] = timezone.now()
+            ids = reconcile(
+                model, field, rows, related, options["verify"], **fields
+            )
+            if ids:
+                self.stdout.write(
+                    f"{model._meta.verbose_name_plural}, {field}: "
+                    f"расхождений {len(ids)}"
+                )
+                if model is Recipe and not options["verify"]:
+                    bump_version_on_commit(*recipe_versions(*ids))
+            total += len(ids)
+        if options["verify"] and total:
+            raise CommandError(f"Расхождений в счётчиках: {total}")
+        self.stdout.write(self.style.SUCCESS("Счётчики актуальны."))
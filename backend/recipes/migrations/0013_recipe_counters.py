@@ -0,0 +1,59 @@
+# Generated by Django 3.2 on 2026-10-18 11:12
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'recipes', 'Favorite', 'recipe'),
+    ('recipes', 'Recipe', 'carts_count', 'recipes', 'ShoppingCart', 'recipe'),
+    ('users', 'User', 'followers_count', 'users', 'Follow', 'author'),
+    ('users', 'User', 'recipes_count', 'recipes', 'Recipe', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app, model, field, rows_app, rows, related in COUNTERS:
+        rows = apps.get_model(rows_app, rows)
+        apps.get_model(app, model).objects.update(**{
+            field: Coalesce(
+                models.Subquery(
+                    rows.objects.filter(**{related: models.OuterRef('pk')})
+                    .order_by()
+                    .values(related)
+                    .annotate(count=models.Count('id'))
+                    .values('count')
+                ),
+                0,
+            )
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_image_renditions'),
+        ('users', '0005_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-carts_count', '-id'], name='recipe_carts_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
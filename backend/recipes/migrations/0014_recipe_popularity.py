@@ -0,0 +1,99 @@
+# Generated by Django 3.2 on 2026-10-18 12:05
+
+import math
+from collections import defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+TRENDING_EPOCH = datetime(2024, 1, 1, tzinfo=django.utils.timezone.utc)
+
+
+def get_trending_weight(moment):
+    hours = (moment - TRENDING_EPOCH).total_seconds() / 3600
+    return max(1.0, 1 + hours * math.log(2) / settings.TRENDING_HALF_LIFE)
+
+
+def add_log_weights(total, weight):
+    if total < 1:
+        return weight
+    return max(total, weight) + math.log1p(math.exp(-abs(total - weight)))
+
+
+def fill_popularity(apps, schema_editor):
+    # Веса считаются по записанным created_at, как в
+    # RecipePopularityManager.calculate, иначе удаление старого
+    # добавления вычло бы не тот вес, что был прибавлен.
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipePopularity = apps.get_model('recipes', 'RecipePopularity')
+    scores = defaultdict(lambda: [0, 0.0])
+    for model_name in ('Favorite', 'ShoppingCart'):
+        model = apps.get_model('recipes', model_name)
+        for recipe_id, created_at in model.objects.values_list(
+            'recipe_id', 'created_at'
+        ).iterator():
+            score = scores[recipe_id]
+            score[0] += 1
+            score[1] = add_log_weights(
+                score[1], get_trending_weight(created_at)
+            )
+    RecipePopularity.objects.bulk_create(
+        (
+            RecipePopularity(
+                recipe_id=recipe_id,
+                popular=scores[recipe_id][0],
+                trending=scores[recipe_id][1],
+            )
+            for recipe_id in Recipe.objects.values_list(
+                'id', flat=True
+            ).iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='RecipePopularity',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('popular', models.PositiveIntegerField(default=0, verbose_name='Популярность')),
+                ('trending', models.FloatField(default=0, verbose_name='Популярность сейчас')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipepopularity',
+            index=models.Index(fields=['-popular', '-recipe'], name='popularity_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipepopularity',
+            index=models.Index(fields=['-trending', '-recipe'], name='popularity_trending_idx'),
+        ),
+        migrations.RunPython(fill_popularity, migrations.RunPython.noop),
+    ]
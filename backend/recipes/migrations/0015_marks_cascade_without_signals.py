@@ -0,0 +1,24 @@
+# Generated by Django 3.2 on 2026-10-18 13:10
+
+from django.db import migrations, models
+import recipes.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_recipe_popularity'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='favorite',
+            name='recipe',
+            field=models.ForeignKey(on_delete=recipes.models.cascade_without_signals, related_name='favorite', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AlterField(
+            model_name='shoppingcart',
+            name='recipe',
+            field=models.ForeignKey(on_delete=recipes.models.cascade_without_signals, related_name='cart', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2 on 2026-10-18 11:50
+
+from django.db import migrations, models
+import recipes.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_marks_cascade_without_signals'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipeingredient',
+            name='recipe',
+            field=models.ForeignKey(on_delete=recipes.models.cascade_without_signals, related_name='recipeingredients', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+import django.core.validators
+from django.db import migrations, models
+
+# Предел PositiveSmallIntegerField в PostgreSQL.
+MAX_SMALLINT = 32767
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Повторы ингредиента в рецепте сливаются в одну строку.
+
+    Количества складываются, поэтому списки покупок, посчитанные по
+    сумме строк, остаются верными.
+    """
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    duplicates = (
+        RecipeIngredient.objects.values('recipe', 'ingredient')
+        .annotate(
+            count=models.Count('id'),
+            first_id=models.Min('id'),
+            total=models.Sum('amount'),
+        )
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates.iterator():
+        RecipeIngredient.objects.filter(
+            recipe_id=duplicate['recipe'],
+            ingredient_id=duplicate['ingredient'],
+        ).exclude(id=duplicate['first_id']).delete()
+        RecipeIngredient.objects.filter(id=duplicate['first_id']).update(
+            amount=min(duplicate['total'], MAX_SMALLINT)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_ingredients_cascade_without_signals'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingredient',
+            name='name',
+            field=models.CharField(max_length=245, verbose_name='Название'),
+        ),
+        migrations.AlterField(
+            model_name='recipeingredient',
+            name='amount',
+            field=models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1, 'Минимум 1'), django.core.validators.MaxValueValidator(99999, 'Максимум 99999 единиц')], verbose_name='Количество'),
+        ),
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='recipeingredient',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_recipe_ingredient_recipeingredient'),
+        ),
+    ]
@@ -1,7 +1,15 @@
+import math
+from collections import defaultdict
+from datetime import datetime
+
+from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Abs, Exp, Greatest, Least, Ln
+from django.utils import timezone
 
-from users.models import User
+from users.models import CountersModel, User
 
 
 MAX_LENGTH_FOR_ANY_NAME = 245
@@ -10,6 +18,11 @@ MIN_OF_COOKING = 1
 MAX_OF_COOKING = 60 * 24
 MIN_AMOUNT = 1
 MAX_AMOUNT = 99999
+# Отсчёт весов trending; вес добавления растёт со временем.
+TRENDING_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+# Ограничение аргумента EXP, чтобы он не уходил в машинный ноль.
+MAX_EXPONENT = 700.0
+TRENDING_EPSILON = 1e-9
 
 
 class Tag(models.Model):
@@ -28,6 +41,10 @@ class Tag(models.Model):
         max_length=MAX_LENGTH_FOR_ANY_NAME,
         unique=True,
     )
+    updated_at = models.DateTimeField(
+        verbose_name="Дата изменения",
+        auto_now=True,
+    )
 
     class Meta:
         verbose_name = "Тег"
@@ -46,6 +63,10 @@ class Ingredient(models.Model):
         verbose_name="е.и",
         max_length=MAX_LENGTH_FOR_ANY_NAME,
     )
+    updated_at = models.DateTimeField(
+        verbose_name="Дата изменения",
+        auto_now=True,
+    )
 
     class Meta:
         constraints = [
@@ -61,7 +82,7 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(CountersModel):
     author = models.ForeignKey(
         User,
         verbose_name="Автор",
@@ -77,6 +98,12 @@ class Recipe(models.Model):
         upload_to="recipes/",
         blank=True,
     )
+    image_renditions = models.JSONField(
+        verbose_name="Уменьшенные копии картинки",
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField(verbose_name="Описание")
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -95,9 +122,41 @@ class Recipe(models.Model):
             MaxValueValidator(MAX_OF_COOKING, "Максимум 24 часа"),
         ],
     )
+    # Счётчики ведутся в recipes.signals, сверяются reconcile_counters.
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="В избранном",
+        default=0,
+        editable=False,
+    )
+    carts_count = models.PositiveIntegerField(
+        verbose_name="В корзинах",
+        default=0,
+        editable=False,
+    )
+    updated_at = models.DateTimeField(
+        verbose_name="Дата изменения",
+        auto_now=True,
+    )
+
+    counter_fields = ("favorites_count", "carts_count")
 
     class Meta:
         ordering = ("-id",)
+        indexes = [
+            # Лента автора: WHERE author_id = ... ORDER BY id DESC.
+            models.Index(
+                fields=["author", "-id"], name="recipe_author_id_idx"
+            ),
+            # Сортировки ленты по счётчикам.
+            models.Index(
+                fields=["-favorites_count", "-id"],
+                name="recipe_favorites_count_idx",
+            ),
+            models.Index(
+                fields=["-carts_count", "-id"],
+                name="recipe_carts_count_idx",
+            ),
+        ]
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
 
@@ -105,10 +164,21 @@ class Recipe(models.Model):
         return self.name
 
 
+def cascade_without_signals(collector, field, sub_objs, using):
+    """Каскадное удаление одним запросом, без сигналов удаления.
+
+    Ингредиенты, избранное и корзины удаляемого рецепта не меняют
+    ничьих счётчиков и рейтингов, а списки покупок обновляются один раз
+    в pre_delete рецепта. Сигналы на каждую строку давали бы по
+    несколько UPDATE удаляемого рецепта.
+    """
+    collector.fast_deletes.append(sub_objs)
+
+
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
         Recipe,
-        on_delete=models.CASCADE,
+        on_delete=cascade_without_signals,
         related_name="recipeingredients",
         verbose_name="Рецепт",
     )
@@ -145,10 +215,14 @@ class Favorite(models.Model):
     )
     recipe = models.ForeignKey(
         Recipe,
-        on_delete=models.CASCADE,
+        on_delete=cascade_without_signals,
         related_name="favorite",
         verbose_name="Рецепт",
     )
+    created_at = models.DateTimeField(
+        verbose_name="Дата добавления",
+        auto_now_add=True,
+    )
 
     class Meta:
         ordering = ("-id",)
@@ -170,10 +244,14 @@ class ShoppingCart(models.Model):
     )
     recipe = models.ForeignKey(
         Recipe,
-        on_delete=models.CASCADE,
+        on_delete=cascade_without_signals,
         related_name="cart",
         verbose_name="Рецепт",
     )
+    created_at = models.DateTimeField(
+        verbose_name="Дата добавления",
+        auto_now_add=True,
+    )
 
     class Meta:
         ordering = ("-id",)
@@ -184,3 +262,306 @@ class ShoppingCart(models.Model):
         ]
         verbose_name = "Корзина"
         verbose_name_plural = "Корзины"
+
+
+class ShoppingListItemManager(models.Manager):
+    """Поддержка актуальности списков покупок при изменении корзин."""
+
+    def change_amounts(self, user_ids, amounts):
+        """Изменение количества ингредиентов в списках пользователей.
+
+        amounts - словарь {id ингредиента: изменение количества}.
+        Строки пользователей блокируются, чтобы параллельные изменения
+        одной корзины не теряли друг друга.
+        """
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items()
+            if amount
+        }
+        user_ids = sorted(set(user_ids))
+        if not user_ids or not amounts:
+            return
+        with transaction.atomic():
+            list(
+                User.objects.select_for_update()
+                .filter(id__in=user_ids)
+                .order_by("id")
+                .values_list("id", flat=True)
+            )
+            items = {
+                (item.user_id, item.ingredient_id): item
+                for item in self.filter(
+                    user_id__in=user_ids, ingredient_id__in=amounts
+                )
+            }
+            created, changed, removed = [], [], []
+            for user_id in user_ids:
+                for ingredient_id, amount in amounts.items():
+                    item = items.get((user_id, ingredient_id))
+                    if item is None:
+                        if amount > 0:
+                            created.append(
+                                self.model(
+                                    user_id=user_id,
+                                    ingredient_id=ingredient_id,
+                                    amount=amount,
+                                )
+                            )
+                        continue
+                    item.amount += amount
+                    if item.amount > 0:
+                        changed.append(item)
+                    else:
+                        removed.append(item.id)
+            if removed:
+                self.filter(id__in=removed).delete()
+            if changed:
+                self.bulk_update(changed, ["amount"])
+            if created:
+                self.bulk_create(created)
+
+    def get_recipe_amounts(self, recipe_id, sign=1):
+        return {
+            ingredient_id: sign * amount
+            for ingredient_id, amount in RecipeIngredient.objects.filter(
+                recipe_id=recipe_id
+            ).values_list("ingredient_id", "amount")
+        }
+
+    def lock_recipe(self, recipe_id):
+        """Блокировка рецепта до конца транзакции.
+
+        Изменение ингредиентов рецепта и изменение корзин с ним
+        выполняются по очереди: иначе добавление в корзину могло бы
+        прочитать старые количества, а изменение рецепта - не увидеть
+        ещё не зафиксированную строку корзины.
+        """
+        list(
+            Recipe.objects.select_for_update()
+            .filter(id=recipe_id)
+            .values_list("id", flat=True)
+        )
+
+    @transaction.atomic
+    def add_recipe(self, user_id, recipe_id):
+        """Рецепт добавлен в корзину пользователя."""
+        self.lock_recipe(recipe_id)
+        self.change_amounts([user_id], self.get_recipe_amounts(recipe_id))
+
+    @transaction.atomic
+    def remove_recipe(self, user_id, recipe_id):
+        """Рецепт удалён из корзины пользователя."""
+        self.lock_recipe(recipe_id)
+        self.change_amounts(
+            [user_id], self.get_recipe_amounts(recipe_id, sign=-1)
+        )
+
+    @transaction.atomic
+    def change_recipe(self, recipe_id, amounts):
+        """Ингредиенты рецепта изменены у всех, у кого он в корзине.
+
+        Рецепт должен быть заблокирован lock_recipe до чтения его
+        прежних ингредиентов.
+        """
+        self.lock_recipe(recipe_id)
+        self.change_amounts(
+            ShoppingCart.objects.filter(recipe_id=recipe_id).values_list(
+                "user_id", flat=True
+            ),
+            amounts,
+        )
+
+    @transaction.atomic
+    def delete_recipe(self, recipe_id):
+        """Рецепт удаляется из всех корзин."""
+        self.lock_recipe(recipe_id)
+        self.change_recipe(
+            recipe_id, self.get_recipe_amounts(recipe_id, sign=-1)
+        )
+
+    def calculate(self):
+        """Списки покупок, посчитанные заново по корзинам."""
+        return {
+            (item["recipe__cart__user"], item["ingredient"]): item["total"]
+            for item in RecipeIngredient.objects.filter(
+                recipe__cart__isnull=False
+            )
+            .values("recipe__cart__user", "ingredient")
+            .annotate(total=Sum("amount"))
+            .order_by()
+        }
+
+    def current(self):
+        return {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in self.values_list(
+                "user_id", "ingredient_id", "amount"
+            )
+        }
+
+    @transaction.atomic
+    def rebuild(self):
+        """Полный пересчёт списков покупок."""
+        self.all().delete()
+        self.bulk_create(
+            self.model(user_id=user_id, ingredient_id=ingredient_id,
+                       amount=amount)
+            for (user_id, ingredient_id), amount in self.calculate().items()
+        )
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в корзине пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Ингредиент",
+    )
+    amount = models.PositiveIntegerField("Количество")
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="unique_user_ingredient_shopping_list",
+            )
+        ]
+        verbose_name = "Строка списка покупок"
+        verbose_name_plural = "Списки покупок"
+
+
+def get_trending_weight(moment):
+    """Логарифм веса добавления рецепта в избранное или корзину.
+
+    Вес удваивается каждые TRENDING_HALF_LIFE часов, поэтому свежие
+    добавления значат больше старых, а порядок рецептов по сумме весов
+    со временем не меняется и не требует пересчёта. Логарифм не
+    переполняется; значения не меньше 1, а 0 означает пустую сумму.
+    """
+    hours = (moment - TRENDING_EPOCH).total_seconds() / 3600
+    return max(1.0, 1 + hours * math.log(2) / settings.TRENDING_HALF_LIFE)
+
+
+def add_log_weights(total, weight):
+    """log(exp(total) + exp(weight)) без переполнения."""
+    if total < 1:
+        return weight
+    return max(total, weight) + math.log1p(math.exp(-abs(total - weight)))
+
+
+class RecipePopularityManager(models.Manager):
+    """Поддержка рейтингов при изменении избранного и корзин."""
+
+    def add(self, recipe_id, moment):
+        """Рецепт добавлен в избранное или корзину в момент moment."""
+        weight = Value(get_trending_weight(moment))
+        trending = F("trending")
+        self.filter(recipe_id=recipe_id).update(
+            popular=F("popular") + 1,
+            trending=Case(
+                When(trending__lt=1, then=weight),
+                default=Greatest(trending, weight) + Ln(
+                    1.0
+                    + Exp(Least(Abs(trending - weight), MAX_EXPONENT) * -1.0)
+                ),
+            ),
+        )
+
+    def remove(self, recipe_id, moment):
+        """Удалено добавление рецепта, сделанное в момент moment."""
+        weight = get_trending_weight(moment)
+        trending = F("trending")
+        self.filter(recipe_id=recipe_id).update(
+            popular=Greatest(F("popular") - 1, 0),
+            trending=Case(
+                When(
+                    trending__gt=weight + TRENDING_EPSILON,
+                    then=trending + Ln(
+                        1.0 - Exp(
+                            Greatest(Value(weight) - trending, -MAX_EXPONENT)
+                        )
+                    ),
+                ),
+                default=Value(0.0),
+            ),
+        )
+
+    def calculate(self):
+        """Рейтинги, посчитанные заново по избранному и корзинам."""
+        scores = defaultdict(lambda: [0, 0.0])
+        for model in (Favorite, ShoppingCart):
+            for recipe_id, created_at in model.objects.values_list(
+                "recipe_id", "created_at"
+            ).iterator():
+                score = scores[recipe_id]
+                score[0] += 1
+                score[1] = add_log_weights(
+                    score[1], get_trending_weight(created_at)
+                )
+        return {
+            recipe_id: tuple(scores.get(recipe_id, (0, 0.0)))
+            for recipe_id in Recipe.objects.values_list("id", flat=True)
+        }
+
+    @transaction.atomic
+    def rebuild(self):
+        """Полный пересчёт рейтингов всех рецептов."""
+        self.all().delete()
+        self.bulk_create(
+            (
+                self.model(
+                    recipe_id=recipe_id, popular=popular, trending=trending
+                )
+                for recipe_id, (popular, trending) in (
+                    self.calculate().items()
+                )
+            ),
+            batch_size=1000,
+        )
+
+
+class RecipePopularity(models.Model):
+    """Рейтинг рецепта для лент popular и trending.
+
+    popular - число добавлений в избранное и корзины за всё время,
+    trending - логарифм суммы их весов (см. get_trending_weight).
+    Строка есть у каждого рецепта, поэтому лента - это чтение индекса
+    рейтинга, а не группировка избранного на каждый запрос.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="popularity",
+        verbose_name="Рецепт",
+    )
+    popular = models.PositiveIntegerField("Популярность", default=0)
+    trending = models.FloatField("Популярность сейчас", default=0)
+
+    objects = RecipePopularityManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["-popular", "-recipe"],
+                name="popularity_popular_idx",
+            ),
+            models.Index(
+                fields=["-trending", "-recipe"],
+                name="popularity_trending_idx",
+            ),
+        ]
+        verbose_name = "Рейтинг рецепта"
+        verbose_name_plural = "Рейтинги рецептов"
@@ -0,0 +1,281 @@
+from collections import Counter
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from recipes.counters import change_counter
+from recipes.images import (
+    delete_unreferenced,
+    get_recipe_files,
+    needs_renditions,
+    schedule_renditions,
+)
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipePopularity,
+    ShoppingCart,
+    ShoppingListItem,
+    Tag,
+)
+from recipes.versions import bump_version
+from users.models import Follow, User
+
+
+# Изменился справочник тегов или ингредиентов, sender - модель.
+reference_data_changed = Signal()
+
+
+def bump_version_on_commit(*names):
+    """Сброс версий сразу и ещё раз после фиксации транзакции.
+
+    Второй сброс нужен, чтобы другой процесс, успевший перечитать
+    данные до фиксации, не закэшировал их под новой версией.
+    """
+    def bump():
+        for name in names:
+            bump_version(name)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def recipe_versions(*recipe_ids):
+    return ("recipes", *(f"recipe:{id}" for id in recipe_ids))
+
+
+def touch_recipes(recipes):
+    """Обновление даты изменения рецептов, чьё представление поменялось."""
+    recipes.update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredient_changed(instance, **kwargs):
+    if not kwargs.get("created", True):
+        touch_recipes(Recipe.objects.filter(ingredients=instance))
+    bump_version_on_commit("ingredients")
+    reference_data_changed.send(sender=Ingredient)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(instance, **kwargs):
+    if not kwargs.get("created", True):
+        touch_recipes(Recipe.objects.filter(tags=instance))
+    bump_version_on_commit("tags")
+    reference_data_changed.send(sender=Tag)
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleted(instance, **kwargs):
+    touch_recipes(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleted(instance, **kwargs):
+    touch_recipes(Recipe.objects.filter(tags=instance))
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    bump_version_on_commit(*recipe_versions(instance.id))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_changed(instance, **kwargs):
+    if needs_renditions(instance):
+        transaction.on_commit(partial(schedule_renditions, instance.id))
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_updating(instance, raw, **kwargs):
+    """Перенос рецепта к другому автору и замена картинки."""
+    if instance.id is None or raw:
+        return
+    previous = (
+        Recipe.objects.filter(id=instance.id)
+        .values_list("author_id", "image", "image_renditions")
+        .first()
+    )
+    if previous is None:
+        return
+    author_id, *files = previous
+    if author_id != instance.author_id:
+        change_counter(User, "recipes_count", author_id, -1)
+        change_counter(User, "recipes_count", instance.author_id, 1)
+    # Новая картинка ещё не записана в хранилище.
+    if not (instance.image and instance.image._committed):
+        transaction.on_commit(
+            partial(delete_unreferenced, get_recipe_files(*files))
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    transaction.on_commit(
+        partial(
+            delete_unreferenced,
+            get_recipe_files(instance.image.name, instance.image_renditions),
+        )
+    )
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(instance, **kwargs):
+    """Рецепт вычитается из списков покупок, пока его корзины целы.
+
+    Ингредиенты и корзины рецепта удаляются без сигналов, так что
+    каждый список меняется один раз при любом способе удаления.
+    """
+    ShoppingListItem.objects.delete_recipe(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipe_counted(instance, signal, created=False, raw=False, **kwargs):
+    if raw or (signal is post_save and not created):
+        return
+    change_counter(
+        User, "recipes_count", instance.author_id, 1 if created else -1
+    )
+    if created:
+        RecipePopularity.objects.create(recipe=instance)
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+@receiver([post_save, post_delete], sender=ShoppingCart)
+def recipe_marked(
+    sender, instance, signal, created=False, raw=False, **kwargs
+):
+    """Рецепт добавлен в избранное или корзину либо удалён оттуда.
+
+    Счётчики видны в ответах API, поэтому рецепт считается изменённым.
+    Сбрасывается только версия рецепта: списки с его счётчиками
+    обновляются через RECIPE_LIST_COUNTERS_MAX_AGE секунд, а если
+    задержка не больше нуля - сразу.
+    """
+    if raw or (signal is post_save and not created):
+        return
+    field = "favorites_count" if sender is Favorite else "carts_count"
+    change_counter(
+        Recipe,
+        field,
+        instance.recipe_id,
+        1 if created else -1,
+        updated_at=timezone.now(),
+    )
+    if created:
+        RecipePopularity.objects.add(instance.recipe_id, instance.created_at)
+    else:
+        RecipePopularity.objects.remove(
+            instance.recipe_id, instance.created_at
+        )
+    if settings.RECIPE_LIST_COUNTERS_MAX_AGE > 0:
+        bump_version_on_commit(f"recipe:{instance.recipe_id}")
+    else:
+        bump_version_on_commit(*recipe_versions(instance.recipe_id))
+
+
+@receiver([post_save, post_delete], sender=ShoppingCart)
+def recipe_carted(instance, signal, created=False, raw=False, **kwargs):
+    if raw or (signal is post_save and not created):
+        return
+    if created:
+        ShoppingListItem.objects.add_recipe(
+            instance.user_id, instance.recipe_id
+        )
+    else:
+        ShoppingListItem.objects.remove_recipe(
+            instance.user_id, instance.recipe_id
+        )
+
+
+@receiver([post_save, post_delete], sender=Follow)
+def author_followed(instance, signal, created=False, raw=False, **kwargs):
+    if raw or (signal is post_save and not created):
+        return
+    change_counter(
+        User, "followers_count", instance.author_id, 1 if created else -1
+    )
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def recipe_ingredient_changed(instance, **kwargs):
+    bump_version_on_commit(*recipe_versions(instance.recipe_id))
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def recipe_ingredient_updating(instance, raw, **kwargs):
+    """Запоминание прежнего ингредиента для списков покупок.
+
+    Рецепт блокируется до чтения, как и при изменении через API;
+    внутри транзакции (например, в админке) блокировка держится
+    до её конца.
+    """
+    instance._previous_ingredient = None
+    if instance.id is None or raw:
+        return
+    with transaction.atomic():
+        ShoppingListItem.objects.lock_recipe(instance.recipe_id)
+        instance._previous_ingredient = (
+            RecipeIngredient.objects.filter(id=instance.id)
+            .values_list("ingredient_id", "amount")
+            .first()
+        )
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def recipe_ingredient_counted(
+    instance, signal, created=False, raw=False, **kwargs
+):
+    """Изменение ингредиента меняет списки всех, у кого рецепт в корзине.
+
+    bulk_create и bulk_update сигналов не отправляют, такие изменения
+    списков покупок передаются в change_recipe явно.
+    """
+    if raw:
+        return
+    amounts = Counter()
+    if signal is post_delete:
+        amounts[instance.ingredient_id] -= instance.amount
+    else:
+        amounts[instance.ingredient_id] += instance.amount
+        previous = getattr(instance, "_previous_ingredient", None)
+        if previous is not None:
+            ingredient_id, amount = previous
+            amounts[ingredient_id] -= amount
+    ShoppingListItem.objects.change_recipe(instance.recipe_id, amounts)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        bump_version_on_commit(*recipe_versions(instance.id))
+        return
+    if pk_set:
+        touch_recipes(Recipe.objects.filter(id__in=pk_set))
+    bump_version_on_commit("tags", *recipe_versions(*(pk_set or ())))
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, created, update_fields, **kwargs):
+    if created or (
+        update_fields and set(update_fields) <= {"last_login", "password"}
+    ):
+        return
+    recipe_ids = list(instance.recipes.values_list("id", flat=True))
+    if recipe_ids:
+        touch_recipes(Recipe.objects.filter(id__in=recipe_ids))
+    bump_version_on_commit(*recipe_versions(*recipe_ids))
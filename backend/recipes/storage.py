@@ -0,0 +1,43 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файлы с именами по sha256 содержимого.
+
+    Одинаковые файлы хранятся в одном экземпляре: если такой файл уже
+    есть, повторно он не записывается. Содержимое по имени никогда не
+    меняется, поэтому ссылки на файлы можно кэшировать бессрочно.
+    """
+
+    def get_content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, filename = os.path.split(name)
+        ext = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, digest[:2], digest + ext)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        try:
+            # Время изменения - отметка для сборки мусора, что файл
+            # только что снова понадобился.
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            pass
+        else:
+            return name
+        saved = super().save(name, content, max_length)
+        if saved != name:
+            # Тот же файл успел записать параллельный запрос.
+            self.delete(saved)
+        return name
@@ -0,0 +1,37 @@
+import time
+
+from django.core.cache import cache
+
+
+def get_version_key(name):
+    return f"version:{name}"
+
+
+def get_initial_version():
+    # Версия, потерянная кэшем, не должна совпасть с одной из прежних.
+    return time.time_ns()
+
+
+def get_versions(*names):
+    """Текущие версии данных, сбрасывающие зависящие от них кэши."""
+    keys = [get_version_key(name) for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, get_initial_version(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def get_version(name):
+    return get_versions(name)[0]
+
+
+def bump_version(name):
+    """Увеличение версии после изменения данных."""
+    key = get_version_key(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, get_initial_version(), timeout=None)
+        return cache.get(key)
@@ -12,15 +12,9 @@ class CustomUserAdmin(UserAdmin):
         "pk",
         "username",
         "email",
-        "get_follows_count",
-        "get_recipes_count",
+        "followers_count",
+        "recipes_count",
     )
 
-    def get_follows_count(self, obj):
-        return obj.following.count()
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 admin.site.register(Follow)
@@ -0,0 +1,24 @@
+# Generated by Django 3.2 on 2026-10-18 10:47
+
+import django.contrib.auth.validators
+from django.db import migrations, models
+import users.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_auto_20230905_2026'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='username',
+            field=models.CharField(max_length=25, unique=True, validators=[users.validators.validate_username, django.contrib.auth.validators.UnicodeUsernameValidator], verbose_name='Имя пользователя'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['author', 'user'], name='follow_author_user_idx'),
+        ),
+    ]
@@ -10,7 +10,35 @@ MAX_LENGTH_FOR_EMAIL = 254
 MAX_LENGTH_FOR_PASSWORD = 150
 
 
-class User(AbstractUser):
+class CountersModel(models.Model):
+    """Модель со счётчиками, которые меняются только запросами UPDATE.
+
+    Сохранение объекта целиком не записывает счётчики, поэтому не
+    затирает их значениями, прочитанными до параллельных изменений.
+    """
+
+    counter_fields = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, update_fields=None, **kwargs):
+        if not self._state.adding and not kwargs.get("force_insert"):
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key and field.attname not in deferred
+                ]
+            update_fields = [
+                name for name in update_fields
+                if name not in self.counter_fields
+            ]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+
+class User(CountersModel, AbstractUser):
     email = models.EmailField(
         max_length=MAX_LENGTH_FOR_EMAIL,
         verbose_name="Эл. почта",
@@ -34,6 +62,19 @@ class User(AbstractUser):
         verbose_name="Фамилия",
         max_length=MAX_LENGTH_FOR_ANY_NAME,
     )
+    # Счётчики ведутся в recipes.signals, сверяются reconcile_counters.
+    followers_count = models.PositiveIntegerField(
+        verbose_name="Подписчиков",
+        default=0,
+        editable=False,
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name="Рецептов",
+        default=0,
+        editable=False,
+    )
+
+    counter_fields = ("followers_count", "recipes_count")
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = [
@@ -82,6 +123,12 @@ class Follow(models.Model):
                 name="user_is_not_author"
             ),
         ]
+        indexes = [
+            # Подписчики автора; unique_follow начинается с user.
+            models.Index(
+                fields=["author", "user"], name="follow_author_user_idx"
+            ),
+        ]
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
 